@@ -4,6 +4,18 @@ from PIL import Image, ImageTk, ImageOps
 from colorsys import hsv_to_rgb
 import os
 import json
+import queue
+import threading
+from bake_engine import BakeCancelled, DraftBake, as_rgba, bake_team_color_strips, glow_mask, transform_badge
+from bake_batch import bake_factions, faction_dirname, write_outputs
+from bake_dds import DDS_FORMATS
+from bake_io import ENCODE_PRESETS, load_texture, resample_cache, texture_cache
+from bake_metrics import BakeMetrics, format_cache, format_stages, stage
+from bake_preview import PreviewCache, hue_strip, sv_square
+from bake_presets import parse_presets, normalize_hex, hex_to_rgb_tuple
+
+# Transformed badges kept per (size, rotation, alpha, filter) while placing a badge
+BADGE_CACHE_SIZE = 16
 
 class TeamColorizerApp:
     def load_presets_from_json(self, filename="faction_color_presets_named.json"):
@@ -69,7 +81,21 @@ class TeamColorizerApp:
         self.badge_placement = None
         self.badge_rotation = 0
         self.badge_alpha = 255
+        self.badge_cache = {}
+        self.badge_preview_key = None
+        self.preview_cache = PreviewCache()
+        self.bake_thread = None
+        self.live_preview = tk.BooleanVar(value=True)
+        self.draft = None
+        self.draft_pending = False
+        self.output_key = None
+        self.stage_records = {}
+        self.metrics_text = tk.StringVar(value="")
         self.mode = tk.StringVar()
+        self.glow_softness = tk.IntVar(value=0)
+        self.glow_feather = tk.DoubleVar(value=0.0)
+        self.encode_preset = tk.StringVar(value="balanced")
+        self.dds_format = tk.StringVar(value="auto")
         self.primary_team_color = (255, 0, 0)  # Default red for primary team regions
         self.secondary_team_color = (0, 0, 255)  # Default blue for secondary team regions
         self.bc_title = "BC Texture"
@@ -82,23 +108,10 @@ class TeamColorizerApp:
         return colorsys.rgb_to_hsv(r / 255.0, g / 255.0, b / 255.0)
 
     def hex_to_rgb_tuple(self, hex_color):
-        h = hex_color.lstrip('#')
-        if len(h) != 6:
-            raise ValueError("Invalid hex color")
-        return (int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16))
+        return hex_to_rgb_tuple(hex_color)
     
     def normalize_hex(self, h):
-        if not isinstance(h, str):
-            return '#000000'
-        h = h.strip()
-        if not h:
-            return '#000000'
-        if not h.startswith('#'):
-            h = '#' + h
-        if len(h) == 4:
-            r = h[1]*2; g = h[2]*2; b = h[3]*2
-            h = f'#{r}{g}{b}'
-        return h.lower()
+        return normalize_hex(h)
 
     def pick_color_gimp_style(self, initial_color, callback):
         dialog = tk.Toplevel(self.root)
@@ -118,20 +131,13 @@ class TeamColorizerApp:
         sb_canvas = tk.Canvas(dialog, width=256, height=256)
         sb_canvas.pack(pady=10)
         def draw_sb():
-            width, height = 256, 256
+            # Whole square rendered as one image (cached per hue) and pasted in one call
+            square = sv_square(hue_var.get())
             if not hasattr(sb_canvas, 'image'):
-                sb_canvas.image = tk.PhotoImage(width=width, height=height)
+                sb_canvas.image = ImageTk.PhotoImage(square)
                 sb_canvas.create_image((0,0), image=sb_canvas.image, anchor='nw')
-            rows = []
-            for y in range(height):
-                row_colors = []
-                v_val = 1 - y / (height-1)
-                for x in range(width):
-                    s_val = x / (width-1)
-                    r_, g_, b_ = hsv_to_rgb(hue_var.get(), s_val, v_val)
-                    row_colors.append(f'#{int(r_*255):02x}{int(g_*255):02x}{int(b_*255):02x}')
-                rows.append("{" + " ".join(row_colors) + "}")
-            sb_canvas.image.put(" ".join(rows))
+            else:
+                sb_canvas.image.paste(square)
         draw_sb()
         def sb_click(event):
             x = max(0, min(255, event.x))
@@ -149,12 +155,8 @@ class TeamColorizerApp:
         hue_canvas = tk.Canvas(dialog, width=256, height=20, bg=self.colors['bg_card'], highlightthickness=1, highlightcolor=self.colors['border'])
         hue_canvas.pack(pady=5)
         def draw_hue():
-            width = 256
-            for x in range(width):
-                h = x / (width - 1)
-                r, g, b = hsv_to_rgb(h, 1, 1)
-                color = f'#{int(r*255):02x}{int(g*255):02x}{int(b*255):02x}'
-                hue_canvas.create_line(x, 0, x, 20, fill=color)
+            hue_canvas.image = ImageTk.PhotoImage(hue_strip(256, 20))
+            hue_canvas.create_image((0, 0), image=hue_canvas.image, anchor='nw')
         def update_hue_marker():
             hue_canvas.delete("marker")
             x = int(hue_var.get() * 255)
@@ -202,6 +204,22 @@ class TeamColorizerApp:
             self.glow_button_frame = frame
         return frame
 
+    def create_glow_settings(self, parent):
+        # Soft threshold ramp and feather radius for the glow mask; 0/0 is the classic hard cut
+        frame = ttk.Frame(parent, style='Card.TFrame')
+        ttk.Label(frame, text="Glow softness:", style='Body.TLabel').pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(frame, from_=0, to=127, increment=1, width=5, textvariable=self.glow_softness).pack(side=tk.LEFT, padx=(0, 15))
+        ttk.Label(frame, text="Feather:", style='Body.TLabel').pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Spinbox(frame, from_=0, to=50, increment=0.5, width=5, textvariable=self.glow_feather).pack(side=tk.LEFT)
+        self.glow_settings_frame = frame
+        return frame
+
+    def glow_options(self):
+        try:
+            return {"softness": max(0, int(self.glow_softness.get())), "feather": max(0.0, float(self.glow_feather.get()))}
+        except (tk.TclError, ValueError):
+            return {}
+
     def create_modern_color_picker(self, parent, text, initial_color, command, column=0, row=0):
         frame = ttk.Frame(parent, style='Card.TFrame')
         frame.grid(row=row, column=column, padx=(0, 5) if column == 0 else (5, 0), pady=(0, 10), sticky="nsew")
@@ -279,23 +297,7 @@ class TeamColorizerApp:
                 try:
                     with open(p, "r", encoding="utf-8") as f:
                         data = json.load(f)
-                    loaded = {}
-                    if isinstance(data, dict):
-                        for k, v in data.items():
-                            if isinstance(v, dict):
-                                ph = self.normalize_hex(v.get("primary") or v.get("primary_hex") or v.get("p") or "")
-                                sh = self.normalize_hex(v.get("secondary") or v.get("secondary_hex") or v.get("s") or "")
-                                if ph and sh:
-                                    loaded[k] = (ph, sh)
-                    elif isinstance(data, list):
-                        for item in data:
-                            if not isinstance(item, dict):
-                                continue
-                            name = item.get("faction") or item.get("name") or item.get("key")
-                            ph = self.normalize_hex(item.get("primary") or item.get("primary_hex") or "")
-                            sh = self.normalize_hex(item.get("secondary") or item.get("secondary_hex") or "")
-                            if name and ph and sh:
-                                loaded[name] = (ph, sh)
+                    loaded = parse_presets(data)
                     if not loaded:
                         messagebox.showwarning("Presets", f"The file {p} was read but contains no recognizable pairs.")
                         continue
@@ -375,6 +377,7 @@ class TeamColorizerApp:
     def setup_ui(self):
         self.setup_modern_styles()
         self.create_mode_selector()
+        self.create_status_bar()
         self.create_main_layout()
         self.on_mode_change()  # Initialize based on default mode
 
@@ -443,7 +446,15 @@ class TeamColorizerApp:
         label.pack(side=tk.LEFT)
         combo = ttk.Combobox(frame, textvariable=self.mode, values=["Homeworld 3", "Homeworld Remastered"], state="readonly")
         combo.pack(side=tk.LEFT, padx=(10, 0))
+        # PNG compression / DDS block encoder quality for saved results: fast while iterating, final for shipping
+        ttk.Label(frame, text="Encoding:", style='Body.TLabel').pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Combobox(frame, textvariable=self.encode_preset, values=list(ENCODE_PRESETS), state="readonly", width=10).pack(side=tk.LEFT, padx=(10, 0))
+        ttk.Label(frame, text="DDS:", style='Body.TLabel').pack(side=tk.LEFT, padx=(20, 0))
+        ttk.Combobox(frame, textvariable=self.dds_format, values=list(DDS_FORMATS), state="readonly", width=6).pack(side=tk.LEFT, padx=(10, 0))
         self.mode.trace_add("write", self.on_mode_change)
+        self.live_preview.trace_add("write", lambda *args: self.schedule_draft())
+        for var in (self.glow_softness, self.glow_feather):
+            var.trace_add("write", lambda *args: self.invalidate_draft())
 
     def on_mode_change(self, *args):
         mode = self.mode.get()
@@ -454,6 +465,7 @@ class TeamColorizerApp:
             self.mask_button_frame.pack_forget()
             self.mask_frame.grid_remove()
             self.glow_button_frame.pack(fill=tk.X, pady=(0, 10))
+            self.glow_settings_frame.pack(fill=tk.X, pady=(0, 10), after=self.glow_button_frame)
             self.team_hint_label.grid(row=1, column=0, columnspan=2, pady=(5, 5), sticky="w")
             self.primary_team_picker.grid(row=2, column=0, padx=(0, 5), pady=(0, 10), sticky="nsew")
             self.secondary_team_picker.grid(row=2, column=1, padx=(5, 0), pady=(0, 10), sticky="nsew")
@@ -464,12 +476,14 @@ class TeamColorizerApp:
             self.bc_text_label.config(text="BC Texture")
             self.bc_title_label.config(text="BC Texture")
             self.glow_button_frame.pack_forget()
+            self.glow_settings_frame.pack_forget()
             self.mask_button_frame.pack(fill=tk.X, pady=(0, 10))
             self.mask_frame.grid(row=1, column=0, padx=10, pady=10, sticky="nsew")
             self.team_hint_label.grid_remove()
             self.primary_team_picker.grid_remove()
             self.secondary_team_picker.grid_remove()
             self.glow_frame.grid_remove()
+        self.textures_changed()
         self.root.update_idletasks()
 
     def create_header(self):
@@ -492,6 +506,22 @@ class TeamColorizerApp:
         value_label.pack(side=tk.LEFT, padx=(5, 0))
         return {'dot': dot, 'label': value_label}
 
+    def create_status_bar(self):
+        frame = ttk.Frame(self.root, style='Card.TFrame', padding=(10, 4))
+        frame.pack(fill=tk.X, side=tk.BOTTOM)
+        ttk.Label(frame, text="⏱️", style='Body.TLabel').pack(side=tk.LEFT, padx=(0, 5))
+        ttk.Label(frame, textvariable=self.metrics_text, style='Status.TLabel').pack(side=tk.LEFT)
+
+    def record_stages(self, metrics):
+        # Latest timing of each stage (load, resize, bake, glow, save) and the texture cache, shown in the status bar
+        for record in metrics.records():
+            self.stage_records[record["stage"]] = record
+        text = format_stages(self.stage_records.values())
+        stats = texture_cache.stats()
+        if stats["hits"] + stats["misses"]:
+            text += " · " + format_cache(stats)
+        self.metrics_text.set(text)
+
     def create_main_layout(self):
         main_frame = ttk.Frame(self.root, style='Modern.TFrame', padding=20)
         main_frame.pack(fill=tk.BOTH, expand=True, pady=(0, 20))
@@ -508,6 +538,7 @@ class TeamColorizerApp:
         self.create_modern_file_button(texture_frame, "TEAM Texture", self.load_team, self.colors['accent_primary'])
         self.create_modern_file_button(texture_frame, "MASK Texture", self.load_mask, self.colors['accent_warning'])
         self.create_modern_file_button(texture_frame, "GLOW Texture", self.load_glow, self.colors['accent_warning'])
+        self.create_glow_settings(texture_frame)
         self.create_modern_file_button(texture_frame, "BADGE Image", self.load_badge, self.colors['accent_error'])
         color_frame = ttk.LabelFrame(panel, text="Team Colors", padding=15, style='Card.TFrame')
         color_frame.pack(fill=tk.X, pady=(0, 20))
@@ -519,6 +550,7 @@ class TeamColorizerApp:
         self.team_hint_label.grid(row=1, column=0, columnspan=2, pady=(5, 5), sticky="w")
         self.primary_team_picker = self.create_modern_color_picker(color_frame, "Primary Team", self.primary_team_color, self.pick_primary_team_color, column=0, row=2)
         self.secondary_team_picker = self.create_modern_color_picker(color_frame, "Secondary Team", self.secondary_team_color, self.pick_secondary_team_color, column=1, row=2)
+        ttk.Checkbutton(color_frame, text="⚡ Live preview (draft resolution)", variable=self.live_preview).grid(row=3, column=0, columnspan=2, pady=(5, 0), sticky="w")
         self.create_presets_panel(panel)
         action_frame = ttk.Frame(panel, padding=2, style='Card.TFrame')
         action_frame.pack(fill=tk.X, pady=(0, 0))
@@ -529,7 +561,9 @@ class TeamColorizerApp:
         place_badge_btn = tk.Button(action_frame_row, text="🛡️ Place Badge", command=self.start_place_badge, bg=self.colors['bg_secondary'], fg=self.colors['text_secondary'], activebackground=self.colors['hover'], activeforeground=self.colors['text_primary'], font=('Helvetica', 10), relief='flat', borderwidth=0, highlightthickness=0, padx=16, pady=10)
         place_badge_btn.pack(side=tk.LEFT, padx=(5, 5))
         save_btn = tk.Button(action_frame_row, text="💾 Save Result", command=self.save_output, bg=self.colors['bg_secondary'], fg=self.colors['text_secondary'], activebackground=self.colors['hover'], activeforeground=self.colors['text_primary'], font=('Helvetica', 10), relief='flat', borderwidth=0, highlightthickness=0, padx=16, pady=10)
-        save_btn.pack(side=tk.LEFT, padx=(5, 0))
+        save_btn.pack(side=tk.LEFT, padx=(5, 5))
+        bake_all_btn = tk.Button(action_frame_row, text="🗂️ Bake All Presets", command=self.bake_all_presets, bg=self.colors['bg_secondary'], fg=self.colors['text_secondary'], activebackground=self.colors['hover'], activeforeground=self.colors['text_primary'], font=('Helvetica', 10), relief='flat', borderwidth=0, highlightthickness=0, padx=16, pady=10)
+        bake_all_btn.pack(side=tk.LEFT, padx=(5, 0))
         return panel
 
     def create_right_panel(self, parent):
@@ -595,10 +629,14 @@ class TeamColorizerApp:
         )
         if path:
             try:
-                self.bc_image = Image.open(path).convert("RGBA")
+                metrics = BakeMetrics()
+                with metrics.stage("load"):
+                    self.bc_image = load_texture(path, texture_cache)
+                self.record_stages(metrics)
                 filename = os.path.basename(path)
                 self.bc_loaded.set(f"✅ {filename}")
                 self.update_preview("BC Texture", self.bc_image)
+                self.textures_changed()
                 self.show_success_message("BC texture loaded successfully", filename)
             except Exception as e:
                 self.show_error_message("Failed to load BC texture", str(e))
@@ -615,10 +653,14 @@ class TeamColorizerApp:
         )
         if path:
             try:
-                self.team_image = Image.open(path).convert("RGBA")
+                metrics = BakeMetrics()
+                with metrics.stage("load"):
+                    self.team_image = load_texture(path, texture_cache)
+                self.record_stages(metrics)
                 filename = os.path.basename(path)
                 self.team_loaded.set(f"✅ {filename}")
                 self.update_preview("TEAM Texture", self.team_image)
+                self.textures_changed()
                 self.show_success_message("TEAM texture loaded successfully", filename)
             except Exception as e:
                 self.show_error_message("Failed to load TEAM texture", str(e))
@@ -635,10 +677,14 @@ class TeamColorizerApp:
         )
         if path:
             try:
-                self.mask_image = Image.open(path).convert("RGBA")
+                metrics = BakeMetrics()
+                with metrics.stage("load"):
+                    self.mask_image = load_texture(path, texture_cache)
+                self.record_stages(metrics)
                 filename = os.path.basename(path)
                 self.mask_loaded.set(f"✅ {filename}")
                 self.update_preview("MASK Texture", self.mask_image)
+                self.textures_changed()
                 self.show_success_message("MASK texture loaded successfully", filename)
             except Exception as e:
                 self.show_error_message("Failed to load MASK texture", str(e))
@@ -655,10 +701,14 @@ class TeamColorizerApp:
         )
         if path:
             try:
-                self.glow_image = Image.open(path).convert("RGBA")
+                metrics = BakeMetrics()
+                with metrics.stage("load"):
+                    self.glow_image = load_texture(path, texture_cache)
+                self.record_stages(metrics)
                 filename = os.path.basename(path)
                 self.glow_loaded.set(f"✅ {filename}")
                 self.update_preview("Glow Texture", self.glow_image)
+                self.textures_changed()
                 self.show_success_message("GLOW texture loaded successfully", filename)
             except Exception as e:
                 self.show_error_message("Failed to load GLOW texture", str(e))
@@ -675,7 +725,11 @@ class TeamColorizerApp:
         )
         if path:
             try:
-                self.badge_image = Image.open(path).convert("RGBA")
+                metrics = BakeMetrics()
+                with metrics.stage("load"):
+                    self.badge_image = load_texture(path, texture_cache)
+                self.record_stages(metrics)
+                self.badge_cache = {}
                 filename = os.path.basename(path)
                 self.badge_loaded.set(f"✅ {filename}")
                 self.show_success_message("Badge image loaded successfully", filename)
@@ -699,7 +753,7 @@ class TeamColorizerApp:
             else:
                 new_height = canvas_height
                 new_width = int(canvas_height * image_ratio)
-            thumbnail = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+            thumbnail = self.preview_cache.thumbnail(preview_name, image, (new_width, new_height))
             thumbnail_tk = ImageTk.PhotoImage(thumbnail)
             x_offset = (canvas_width - new_width) // 2
             y_offset = (canvas_height - new_height) // 2
@@ -779,10 +833,59 @@ class TeamColorizerApp:
     def set_color1(self, color):
         self.color1 = color
         self.update_color_preview(self.color1_canvas, self.color1)
+        self.schedule_draft()
 
     def set_color2(self, color):
         self.color2 = color
         self.update_color_preview(self.color2_canvas, self.color2)
+        self.schedule_draft()
+
+    def bake_key(self):
+        glow = self.glow_options() if self.mode.get() == "Homeworld Remastered" else {}
+        return (self.color1, self.color2, self.mode.get(), tuple(sorted(glow.items())))
+
+    def output_is_current(self):
+        return self.output_image is not None and self.output_key == self.bake_key()
+
+    def textures_changed(self):
+        self.output_key = None
+        # Resizes of replaced textures are never used again
+        resample_cache.retain([self.bc_image, self.team_image, self.mask_image, self.glow_image])
+        self.invalidate_draft()
+
+    def invalidate_draft(self):
+        self.draft = None
+        self.schedule_draft()
+
+    def schedule_draft(self):
+        # A preset sets both colors; coalesce into a single draft bake
+        if not self.draft_pending:
+            self.draft_pending = True
+            self.root.after_idle(self.refresh_draft)
+
+    def refresh_draft(self):
+        self.draft_pending = False
+        if not self.live_preview.get() or self.bc_image is None or self.team_image is None:
+            return
+        if self.output_is_current():
+            # Back on the baked colors: show what Save writes, not the last draft
+            self.update_preview("Result", self.output_image)
+            if self.glow_output_image is not None and self.mode.get() == "Homeworld Remastered":
+                self.update_preview("Glow Texture", self.glow_output_image)
+            return
+        try:
+            if self.draft is None:
+                mode = self.mode.get()
+                glow = self.glow_image if mode == "Homeworld Remastered" else None
+                self.draft = DraftBake(self.bc_image, self.team_image, self.mask_image, glow, mode, self.glow_options(),
+                                       cache=resample_cache)
+            output, glow_output = self.draft.bake(self.color1, self.color2)
+        except Exception as e:
+            print(f"❌ Draft preview failed: {e}")
+            return
+        self.update_preview("Result", output)
+        if glow_output is not None:
+            self.update_preview("Glow Texture", glow_output)
 
     def set_primary_team_color(self, color):
         self.primary_team_color = color
@@ -798,84 +901,96 @@ class TeamColorizerApp:
         canvas.config(highlightcolor=self.colors['accent_primary'],
                      highlightbackground=self.colors['border'])
 
-    def apply_team_color(self):
+    def apply_team_color(self, on_done=None):
         if self.bc_image is None or self.team_image is None:
             self.show_warning_message("Load BC and TEAM textures first")
             return
-        self.show_progress_dialog("Applying Team Colors", "Processing textures...")
+        if self.bake_thread is not None and self.bake_thread.is_alive():
+            return
+        # Tk variables are read here; the worker thread only sees plain values
+        mode = self.mode.get()
+        glow = self.glow_options() if mode == "Homeworld Remastered" and self.glow_image is not None else None
+        key = self.bake_key()
+        cancel = threading.Event()
+        results = queue.Queue()
+        self.show_progress_dialog("Applying Team Colors", "Processing textures...", cancel=cancel.set)
+        self.bake_thread = threading.Thread(target=self.run_bake, args=(mode, glow, cancel, results), daemon=True)
+        self.bake_thread.start()
+        self.root.after(50, self.poll_bake, results, key, on_done)
+
+    def run_bake(self, mode, glow, cancel, results):
+        # Worker thread: progress and the outcome go back through the queue
+        def progress(done, total):
+            # Also called between stages: at 8K the resizes and the glow mask take seconds
+            if cancel.is_set():
+                raise BakeCancelled()
+            results.put(("progress", done / total))
+        metrics = BakeMetrics()
         try:
-            result_image = self.process_team_color()
-            self.output_image = result_image
-            if self.mode.get() == "Homeworld Remastered" and self.glow_image is not None:
-                self.generate_glow_texture()
-                self.update_preview("Glow Texture", self.glow_output_image)
-            self.update_preview("Result", result_image)
-            self.hide_progress_dialog()
-            self.show_success_message("Team Color Applied", "Colorization completed successfully!")
+            output, glow_output = self.process_team_color(mode, progress, metrics, glow)
+            results.put(("done", (output, glow_output, metrics)))
+        except BakeCancelled:
+            results.put(("cancelled", None))
         except Exception as e:
+            results.put(("error", e))
+
+    def poll_bake(self, results, key, on_done):
+        while True:
+            try:
+                kind, value = results.get_nowait()
+            except queue.Empty:
+                self.root.after(50, self.poll_bake, results, key, on_done)
+                return
+            if kind == "progress":
+                self.progress_bar['value'] = value * 100
+                continue
             self.hide_progress_dialog()
-            self.show_error_message("Processing Error", f"Failed to apply team color: {str(e)}")
-
-    def process_team_color(self):
-        width, height = self.bc_image.size
-        if self.team_image.size != self.bc_image.size:
-            self.team_image = self.team_image.resize((width, height))
-        if self.mask_image and self.mask_image.size != self.bc_image.size:
-            self.mask_image = self.mask_image.resize((width, height))
-        bc_pixels = self.bc_image.load()
-        team_pixels = self.team_image.load()
-        mask_pixels = self.mask_image.load() if self.mask_image else None
-        output = Image.new("RGBA", (width, height))
-        output_pixels = output.load()
-        for y in range(height):
-            for x in range(width):
-                bc_r, bc_g, bc_b, bc_a = bc_pixels[x, y]
-                factor = self.get_mask_factor(x, y, mask_pixels)
-                if self.mode.get() == "Homeworld Remastered":
-                    r, g, b, a = team_pixels[x, y]
-                    if r > 240 and g > 240 and b < 20:  # yellow
-                        factor = 0.0
-                t = team_pixels[x, y][0] / 255.0  # Use red channel for interpolation
-                team_r = int(self.color1[0] * (1 - t) + self.color2[0] * t)
-                team_g = int(self.color1[1] * (1 - t) + self.color2[1] * t)
-                team_b = int(self.color1[2] * (1 - t) + self.color2[2] * t)
-                colored_r = int(team_r * (bc_r / 255 * 0.75 + 0.25))
-                colored_g = int(team_g * (bc_g / 255 * 0.75 + 0.25))
-                colored_b = int(team_b * (bc_b / 255 * 0.75 + 0.25))
-                final_r = int(bc_r * (1 - factor) + colored_r * factor)
-                final_g = int(bc_g * (1 - factor) + colored_g * factor)
-                final_b = int(bc_b * (1 - factor) + colored_b * factor)
-                output_pixels[x, y] = (final_r, final_g, final_b, bc_a)
-        return output
-
-    def get_mask_factor(self, x, y, mask_pixels):
-        if not mask_pixels:
-            return 1.0
-        r, g, b, a = mask_pixels[x, y]
-        return a / 255.0
-
-    def generate_glow_texture(self):
-        if not self.glow_image or not self.output_image:
+            if kind == "done":
+                self.output_image, glow_output, metrics = value
+                self.output_key = key
+                self.record_stages(metrics)
+                if glow_output is not None:
+                    self.glow_output_image = glow_output
+                    self.update_preview("Glow Texture", self.glow_output_image)
+                self.update_preview("Result", self.output_image)
+                if on_done:
+                    on_done()
+                else:
+                    self.show_success_message("Team Color Applied", "Colorization completed successfully!")
+            elif kind == "error":
+                self.show_error_message("Processing Error", f"Failed to apply team color: {str(value)}")
             return
-        width, height = self.output_image.size
-        if self.glow_image.size != (width, height):
-            self.glow_image = self.glow_image.resize((width, height), Image.Resampling.LANCZOS)
-        glow_pixels = self.glow_image.load()
-        output_pixels = self.output_image.load()
-        glow_output = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-        glow_output_pixels = glow_output.load()
-        for y in range(height):
-            for x in range(width):
-                gr, gg, gb, ga = glow_pixels[x, y]
-                if gg > 128:  # Green channel indicates glow
-                    or_, og, ob, oa = output_pixels[x, y]
-                    glow_output_pixels[x, y] = (or_, og, ob, 255)
-        self.glow_output_image = glow_output
+
+    def process_team_color(self, mode=None, progress=None, metrics=None, glow=None):
+        # The loaded TEAM/MASK stay as they are; resized copies come from the resample cache.
+        # glow: glow_mask options to also make the glow output in the bake pass.
+        size = self.bc_image.size
+        with stage(metrics, "resize"):
+            team = as_rgba(self.team_image, size, cache=resample_cache)
+            if progress:
+                progress(0, 1)
+            mask = as_rgba(self.mask_image, size, cache=resample_cache) if self.mask_image else None
+        if progress:
+            progress(0, 1)
+        lit = None
+        if glow is not None:
+            with stage(metrics, "glow"):
+                lit = glow_mask(self.glow_image, size, cache=resample_cache, **glow)
+            if progress:
+                progress(0, 1)
+        with stage(metrics, "bake"):
+            baked = bake_team_color_strips(self.bc_image, team, mask, self.color1, self.color2,
+                                           mode or self.mode.get(), progress=progress, lit=lit)
+        return baked if lit is not None else (baked, None)
 
     def start_place_badge(self):
         if not self.badge_image:
             self.show_warning_message("Load Badge first")
             return
+        if not self.output_is_current() and self.bc_image is not None and self.team_image is not None:
+            # The preview may be a draft; bake at full resolution first
+            self.apply_team_color(on_done=self.open_badge_placement_window)
+            return
         if not self.output_image:
             self.show_warning_message("Apply Team Color first")
             return
@@ -963,6 +1078,7 @@ class TeamColorizerApp:
         self.badge_placement = [badge_x, badge_y, badge_width, badge_height]
 
         # Show badge and handles
+        self.badge_preview_key = None
         self.update_badge_preview()
 
         # Bindings to move / resize
@@ -1015,7 +1131,7 @@ class TeamColorizerApp:
         self.drag_start_x = 0
         self.drag_start_y = 0
 
-    def update_badge_preview(self):
+    def update_badge_preview(self, fast=False):
         if not self.badge_placement:
             return
         x, y, w, h = self.badge_placement
@@ -1027,15 +1143,17 @@ class TeamColorizerApp:
         self.badge_placement[0] = x
         self.badge_placement[1] = y
         
-        rotated_badge = self.badge_image.rotate(self.badge_rotation, expand=False)
-        badge_resized = rotated_badge.resize(
-            (int(w), int(h)),
-            Image.Resampling.LANCZOS
-        )
-        badge_with_alpha = self.apply_alpha_to_badge(badge_resized)
-        self.badge_tk = ImageTk.PhotoImage(badge_with_alpha)
-        self.badge_canvas.delete("badge")
-        self.badge_canvas.create_image(x, y, anchor=tk.NW, image=self.badge_tk, tags="badge")
+        # Live resizes use a cheap filter; LANCZOS once the handle is released
+        resample = Image.Resampling.BILINEAR if fast else Image.Resampling.LANCZOS
+        key = ((int(w), int(h)), self.badge_rotation, self.badge_alpha, resample)
+        if key == self.badge_preview_key:
+            self.badge_canvas.coords("badge", x, y)
+        else:
+            badge_with_alpha = self.transformed_badge(key[0], resample)
+            self.badge_tk = ImageTk.PhotoImage(badge_with_alpha)
+            self.badge_canvas.delete("badge")
+            self.badge_canvas.create_image(x, y, anchor=tk.NW, image=self.badge_tk, tags="badge")
+            self.badge_preview_key = key
         self.badge_canvas.delete("handles")
         handle_size = 8
         corners = [
@@ -1129,10 +1247,12 @@ class TeamColorizerApp:
                 self.badge_placement[3] = new_h
         self.drag_start_x = event.x
         self.drag_start_y = event.y
-        self.update_badge_preview()
+        self.update_badge_preview(fast=True)
 
     def stop_resize(self, event):
-        self.resizing = False
+        if self.resizing:
+            self.resizing = False
+            self.update_badge_preview()
 
     def update_rotation(self, value):
         self.badge_rotation = int(value)
@@ -1142,18 +1262,15 @@ class TeamColorizerApp:
         self.badge_alpha = int(value)
         self.update_badge_preview()
 
-    def apply_alpha_to_badge(self, image):
-        if self.badge_alpha >= 255:
-            return image
-        badge_copy = image.copy()
-        pixels = badge_copy.load()
-        alpha_factor = self.badge_alpha / 255.0
-        for y in range(badge_copy.height):
-            for x in range(badge_copy.width):
-                r, g, b, a = pixels[x, y]
-                new_a = int(a * alpha_factor)
-                pixels[x, y] = (r, g, b, new_a)
-        return badge_copy
+    def transformed_badge(self, size, resample=Image.Resampling.LANCZOS):
+        key = (size, self.badge_rotation, self.badge_alpha, resample)
+        badge = self.badge_cache.pop(key, None)
+        if badge is None:
+            badge = transform_badge(self.badge_image, size, self.badge_rotation, self.badge_alpha, resample)
+            if len(self.badge_cache) >= BADGE_CACHE_SIZE:
+                self.badge_cache.pop(next(iter(self.badge_cache)))
+        self.badge_cache[key] = badge
+        return badge
 
     def apply_badge(self):
         if not self.output_image or not self.badge_image:
@@ -1166,14 +1283,14 @@ class TeamColorizerApp:
         if orig_w < 10 or orig_h < 10:
             self.badge_window.destroy()
             return
-        rotated_badge = self.badge_image.rotate(self.badge_rotation, expand=False)
-        badge_resized = rotated_badge.resize((orig_w, orig_h), Image.Resampling.LANCZOS)
-        badge_final = self.apply_alpha_to_badge(badge_resized)
+        badge_final = self.transformed_badge((orig_w, orig_h))
         self.output_image.paste(badge_final, (orig_x, orig_y), badge_final if badge_final.mode == 'RGBA' else None)
+        self.preview_cache.invalidate("Result")
         self.update_preview("Result", self.output_image)
         self.badge_window.destroy()
 
-    def show_progress_dialog(self, title, message):
+    def show_progress_dialog(self, title, message, cancel=None):
+        # With a cancel callback the bar is determinate and driven through self.progress_bar['value']
         self.progress_window = tk.Toplevel(self.root)
         self.progress_window.title(title)
         self.progress_window.geometry("400x150")
@@ -1184,9 +1301,16 @@ class TeamColorizerApp:
         content_frame.pack(fill=tk.BOTH, expand=True)
         progress_label = ttk.Label(content_frame, text=message, style='Body.TLabel', font=('Helvetica', 12))
         progress_label.pack(pady=(0, 20))
-        self.progress_bar = ttk.Progressbar(content_frame, mode='indeterminate', style='Horizontal.TProgressbar')
-        self.progress_bar.pack(fill=tk.X, pady=(0, 10))
-        self.progress_bar.start()
+        if cancel is None:
+            self.progress_bar = ttk.Progressbar(content_frame, mode='indeterminate', style='Horizontal.TProgressbar')
+            self.progress_bar.pack(fill=tk.X, pady=(0, 10))
+            self.progress_bar.start()
+        else:
+            self.progress_window.geometry("400x190")
+            self.progress_bar = ttk.Progressbar(content_frame, mode='determinate', maximum=100, style='Horizontal.TProgressbar')
+            self.progress_bar.pack(fill=tk.X, pady=(0, 10))
+            ttk.Button(content_frame, text="Cancel", command=cancel, style='Secondary.TButton').pack()
+            self.progress_window.protocol("WM_DELETE_WINDOW", cancel)
         self.root.update()
 
     def hide_progress_dialog(self):
@@ -1197,30 +1321,114 @@ class TeamColorizerApp:
         messagebox.showwarning("⚠️ Warning", message)
 
     def save_output(self):
+        if not self.output_is_current() and self.bc_image is not None and self.team_image is not None:
+            self.apply_team_color(on_done=self.save_output)
+            return
         if not self.output_image:
             self.show_warning_message("No result to save. Apply Team Color first.")
             return
         path = filedialog.asksaveasfilename(
             defaultextension=".png",
             filetypes=[
-                ("PNG", "*.png"), ("JPEG", "*.jpg"), ("BMP", "*.bmp"),
+                ("PNG", "*.png"), ("DDS", "*.dds"), ("JPEG", "*.jpg"), ("BMP", "*.bmp"),
                 ("TGA", "*.tga"), ("TIFF", "*.tiff"), ("All files", "*.*")
             ]
         )
-        if path:
+        if not path:
+            return
+        glow_output = self.glow_output_image if self.mode.get() == "Homeworld Remastered" else None
+        base, ext = os.path.splitext(path)
+        results = queue.Queue()
+        self.show_progress_dialog("Saving", "Encoding textures...")
+        threading.Thread(target=self.run_save, daemon=True,
+                         args=(self.output_image, glow_output, (path, base + '_glow' + ext), self.encode_preset.get(),
+                               self.dds_format.get(), results)).start()
+        self.root.after(50, self.poll_save, results)
+
+    def run_save(self, output, glow_output, paths, encode, dds_format, results):
+        # Worker thread: the result and glow are encoded concurrently, off the UI thread
+        metrics = BakeMetrics()
+        try:
+            results.put(("done", (write_outputs(output, glow_output, paths, metrics, encode, dds_format), metrics)))
+        except Exception as e:
+            results.put(("error", e))
+
+    def poll_save(self, results):
+        try:
+            kind, value = results.get_nowait()
+        except queue.Empty:
+            self.root.after(50, self.poll_save, results)
+            return
+        self.hide_progress_dialog()
+        if kind == "error":
+            self.show_error_message("Save Error", f"Failed to save file: {str(value)}")
+            return
+        written, metrics = value
+        self.record_stages(metrics)
+        message = f"Result saved as:\n{os.path.basename(written[0])}"
+        if len(written) > 1:
+            message += f"\nGlow saved as:\n{os.path.basename(written[1])}"
+        self.show_success_message("File Saved", message)
+
+    def bake_all_presets(self):
+        if self.bc_image is None or self.team_image is None:
+            self.show_warning_message("Load BC and TEAM textures first")
+            return
+        if not self.presets:
+            self.show_warning_message("Load presets first")
+            return
+        folder = filedialog.askdirectory(title="Select output folder")
+        if not folder:
+            return
+        images = {"bc": self.bc_image, "team": self.team_image}
+        if self.mask_image:
+            images["mask"] = self.mask_image
+        if self.glow_image:
+            images["glow"] = self.glow_image
+        factions = [(name, (self.hex_to_rgb_tuple(ph), self.hex_to_rgb_tuple(sh))) for name, (ph, sh) in self.presets.items()]
+        cancel = threading.Event()
+        results = queue.Queue()
+        self.show_progress_dialog("Baking All Presets", f"Baking {len(factions)} presets...", cancel=cancel.set)
+        threading.Thread(target=self.run_bake_all, daemon=True,
+                         args=(images, factions, self.mode.get(), self.glow_options(), folder,
+                               self.encode_preset.get(), cancel, results)).start()
+        self.root.after(50, self.poll_bake_all, results, folder)
+
+    def run_bake_all(self, images, factions, mode, glow, folder, encode, cancel, results):
+        # Worker thread: bakes and saves one faction at a time, stopping between factions when cancelled
+        metrics = BakeMetrics()
+        try:
+            for done, (faction, output, glow_output) in enumerate(bake_factions(images, factions, mode, glow,
+                                                                               metrics, resample_cache), 1):
+                base = os.path.join(folder, faction_dirname(faction))
+                write_outputs(output, glow_output, (base + ".png", base + "_glow.png"), metrics, encode)
+                results.put(("progress", done / len(factions)))
+                if cancel.is_set():
+                    results.put(("cancelled", (done, metrics)))
+                    return
+            results.put(("done", (len(factions), metrics)))
+        except Exception as e:
+            results.put(("error", e))
+
+    def poll_bake_all(self, results, folder):
+        while True:
             try:
-                self.output_image.save(path)
-                filename = os.path.basename(path)
-                message = f"Result saved as:\n{filename}"
-                if self.mode.get() == "Homeworld Remastered" and self.glow_output_image:
-                    base, ext = os.path.splitext(path)
-                    glow_path = base + '_glow' + ext
-                    self.glow_output_image.save(glow_path)
-                    glow_filename = os.path.basename(glow_path)
-                    message += f"\nGlow saved as:\n{glow_filename}"
-                self.show_success_message("File Saved", message)
-            except Exception as e:
-                self.show_error_message("Save Error", f"Failed to save file: {str(e)}")
+                kind, value = results.get_nowait()
+            except queue.Empty:
+                self.root.after(50, self.poll_bake_all, results, folder)
+                return
+            if kind == "progress":
+                self.progress_bar['value'] = value * 100
+                continue
+            self.hide_progress_dialog()
+            if kind == "error":
+                self.show_error_message("Processing Error", f"Failed to bake presets: {str(value)}")
+                return
+            count, metrics = value
+            self.record_stages(metrics)
+            if kind == "done":
+                self.show_success_message("Presets Baked", f"{count} presets saved to:\n{folder}")
+            return
 
 if __name__ == "__main__":
     root = tk.Tk()
@@ -0,0 +1,170 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from bake_engine import HW3, HWRM, PreparedBake, apply_glow, as_rgba, glow_mask
+from bake_io import TEXTURE_EXTENSIONS, load_texture, save_image
+from bake_metrics import stage
+
+# Filename suffixes (ship_DIFF.tga, ship_TEAM.tga, ...) mapped to texture roles
+ROLE_TAGS = {"BC": "bc", "DIFF": "bc", "TEAM": "team", "MASK": "mask", "GLOW": "glow"}
+ROLES = ("bc", "team", "mask", "glow")
+BADGE_KEYS = ("path", "x", "y", "width", "height")
+MODE_ALIASES = {"hw3": HW3, "hwrm": HWRM, HW3.lower(): HW3, HWRM.lower(): HWRM}
+
+
+def parse_mode(value):
+    if value is None or value == "auto":
+        return None
+    mode = MODE_ALIASES.get(str(value).strip().lower())
+    if mode is None:
+        raise ValueError(f"Unknown mode: {value}")
+    return mode
+
+
+def find_texture_sets(directory):
+    sets = {}
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            stem, ext = os.path.splitext(filename)
+            if ext.lower() not in TEXTURE_EXTENSIONS:
+                continue
+            base, sep, tag = stem.rpartition("_")
+            role = ROLE_TAGS.get(tag.upper())
+            if not sep or role is None:
+                continue
+            name = os.path.normpath(os.path.join(os.path.relpath(root, directory), base))
+            sets.setdefault(name, {"name": name})[role] = os.path.join(root, filename)
+    return [sets[name] for name in sorted(sets)]
+
+
+def load_manifest(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    entries = data.get("ships", []) if isinstance(data, dict) else data
+    base_dir = os.path.dirname(os.path.abspath(path))
+    sets = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        texture_set = {}
+        for role in ROLES:
+            if entry.get(role):
+                texture_set[role] = os.path.join(base_dir, entry[role])
+        name = entry.get("name")
+        if not name and "bc" in texture_set:
+            name = os.path.splitext(os.path.basename(texture_set["bc"]))[0]
+        texture_set["name"] = name or f"ship_{len(sets)}"
+        if entry.get("mode"):
+            texture_set["mode"] = parse_mode(entry["mode"])
+        if entry.get("factions"):
+            texture_set["factions"] = list(entry["factions"])
+        if entry.get("badge"):
+            texture_set["badge"] = parse_badge(entry["badge"], base_dir, texture_set["name"])
+        sets.append(texture_set)
+    return sets
+
+
+def parse_badge(badge, base_dir, name):
+    missing = [key for key in BADGE_KEYS if key not in badge]
+    if missing:
+        raise ValueError(f"{name}: badge needs {', '.join(missing)}")
+    return dict(badge, path=os.path.join(base_dir, badge["path"]))
+
+
+def texture_sets(source):
+    if os.path.isdir(source):
+        return find_texture_sets(source)
+    return load_manifest(source)
+
+
+def resolve_mode(texture_set, default=None):
+    if texture_set.get("mode"):
+        return texture_set["mode"]
+    if default:
+        return default
+    return HWRM if "glow" in texture_set and "mask" not in texture_set else HW3
+
+
+def check_texture_set(texture_set):
+    missing = [role.upper() for role in ("bc", "team") if role not in texture_set]
+    if missing:
+        raise ValueError(f"missing {'/'.join(missing)} texture")
+
+
+def load_texture_set(texture_set, metrics=None, cache=None):
+    check_texture_set(texture_set)
+    with stage(metrics, "load"):
+        return {role: load_texture(texture_set[role], cache) for role in ROLES if role in texture_set}
+
+
+def load_badge(texture_set, metrics=None, cache=None):
+    if not texture_set.get("badge"):
+        return None
+    with stage(metrics, "load"):
+        return load_texture(texture_set["badge"]["path"], cache)
+
+
+def bake_factions(images, factions, mode, glow=None, metrics=None, resample_cache=None):
+    # Color independent work is done once; each faction is then a cheap pass.
+    # glow: optional glow_mask options, {"softness": ..., "feather": ...}
+    # resample_cache: a ResampleCache, for callers that bake the same images again
+    with stage(metrics, "resize"):
+        bc = as_rgba(images["bc"])
+        team = as_rgba(images["team"], bc.size, cache=resample_cache)
+        mask = as_rgba(images["mask"], bc.size, cache=resample_cache) if images.get("mask") is not None else None
+    with stage(metrics, "prepare"):
+        prepared = PreparedBake(bc, team, mask, mode)
+    lit = None
+    if mode == HWRM and "glow" in images:
+        with stage(metrics, "glow"):
+            lit = glow_mask(images["glow"], prepared.size, cache=resample_cache, **(glow or {}))
+    # The jit and numpy backends make the glow output in the bake pass
+    fused = lit is not None and hasattr(prepared, "bake_glow")
+    for faction, (color1, color2) in factions:
+        glow_output = None
+        with stage(metrics, "bake"):
+            if fused:
+                output, glow_output = prepared.bake_glow(color1, color2, lit)
+            else:
+                output = prepared.bake(color1, color2)
+        if lit is not None and not fused:
+            with stage(metrics, "glow"):
+                glow_output = apply_glow(output, lit)
+        yield faction, output, glow_output
+
+
+def bake_images(images, color1, color2, mode, glow=None, metrics=None, resample_cache=None):
+    faction, output, glow_output = next(bake_factions(images, [(None, (color1, color2))], mode, glow, metrics,
+                                                      resample_cache))
+    return output, glow_output
+
+
+def bake_texture_set(texture_set, color1, color2, mode, glow=None, metrics=None):
+    return bake_images(load_texture_set(texture_set, metrics), color1, color2, mode, glow, metrics)
+
+
+def faction_dirname(faction):
+    return re.sub(r"[^\w.-]+", "_", faction).strip("_") or "faction"
+
+
+def output_paths(out_dir, texture_set, faction, ext=".png"):
+    base = os.path.join(out_dir, faction_dirname(faction), texture_set["name"])
+    return base + ext, base + "_glow" + ext
+
+
+def write_outputs(output, glow_output, paths, metrics=None, encode=None, dds_format="auto"):
+    # encode: an ENCODE_PRESETS name; the result and glow are then encoded concurrently.
+    # dds_format: a DDS_FORMATS name, used for .dds paths
+    outputs = [(output, paths[0])] + ([(glow_output, paths[1])] if glow_output is not None else [])
+    with stage(metrics, "save"):
+        if encode is None or len(outputs) == 1:
+            for image, path in outputs:
+                save_image(image, path, encode, dds_format)
+        else:
+            with ThreadPoolExecutor(len(outputs)) as pool:
+                for job in [pool.submit(save_image, image, path, encode, dds_format) for image, path in outputs]:
+                    job.result()
+    return [path for image, path in outputs]
@@ -0,0 +1,217 @@
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import PIL
+from PIL import Image
+
+from bake_engine import BACKEND, HW3, HWRM, bake_team_color, generate_glow, scale_alpha
+from bake_io import load_texture, save_image
+from bake_metrics import peak_rss, reset_peak_rss
+from bake_preview import PreviewCache
+
+# Headless benchmarks for the bake hot paths. Every (size, mode, stage) is timed in
+# a fresh worker process, and measured for memory in another one: there glibc is
+# told to mmap large blocks, so freed images go back to the OS and the peak RSS
+# of the stage is not hidden by heap reuse. Inputs are synthetic and written
+# once per size as uncompressed TGA.
+
+SIZES = (512, 1024, 2048, 4096, 8192)
+STAGES = ("load", "bake", "glow", "badge", "preview", "save")
+PREVIEW_SIZE = (400, 400)
+COLORS = ((220, 38, 127), (33, 150, 243))
+
+
+def synthetic_inputs(size):
+    # Deterministic stand-ins with the features the bake cares about: a TEAM red
+    # ramp, HWRM yellow patches, a mostly binary MASK with soft edges, GLOW on/off
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    rng = np.random.default_rng(size)
+    noise = rng.integers(0, 32, (size, size), dtype=np.uint8)
+    opaque = np.full((size, size), 255, np.uint8)
+    cells = (np.floor(x * 16) + np.floor(y * 16)) % 2 == 0
+    ring = np.abs(np.hypot(x - 0.5, y - 0.5) - 0.3)
+
+    bc = np.dstack([(x * 200).astype(np.uint8) + noise, (y * 200).astype(np.uint8) + noise,
+                    ((1 - x) * 200).astype(np.uint8) + noise, opaque])
+    yellow = cells & (x > 0.75)
+    team = np.dstack([np.where(yellow, 250, x * 255).astype(np.uint8), np.where(yellow, 250, y * 255).astype(np.uint8),
+                      np.where(yellow, 5, 128).astype(np.uint8), opaque])
+    mask_a = np.clip((0.05 - ring) * 255 / 0.01, 0, 255).astype(np.uint8)
+    mask = np.dstack([opaque, opaque, opaque, mask_a])
+    glow = np.dstack([noise, np.where(cells, 200, 60).astype(np.uint8), noise, opaque])
+    badge_side = max(64, size // 4)
+    by, bx = np.mgrid[0:badge_side, 0:badge_side] / badge_side
+    badge_a = np.where(np.hypot(bx - 0.5, by - 0.5) < 0.45, 255, 0).astype(np.uint8)
+    badge = np.dstack([(bx * 255).astype(np.uint8), (by * 255).astype(np.uint8),
+                       np.full(badge_a.shape, 90, np.uint8), badge_a])
+    return {name: Image.fromarray(np.ascontiguousarray(array), "RGBA")
+            for name, array in (("bc", bc), ("team", team), ("mask", mask), ("glow", glow), ("badge", badge))}
+
+
+def write_inputs(size, directory):
+    paths = {}
+    for name, image in synthetic_inputs(size).items():
+        paths[name] = os.path.join(directory, f"bench_{size}_{name.upper()}.tga")
+        image.save(paths[name])
+    return paths
+
+
+def stage_runner(stage, mode, images, out_dir):
+    # Returns (callable, pixels processed per call)
+    bc = images["bc"]
+    pixels = bc.width * bc.height
+    mask = images["mask"] if mode == HW3 else None
+    if stage == "load":
+        paths = images["paths"]
+        roles = ("bc", "team", "mask") if mode == HW3 else ("bc", "team", "glow")
+        return lambda: [load_texture(paths[role]) for role in roles], pixels * len(roles)
+    output = bake_team_color(bc, images["team"], mask, COLORS[0], COLORS[1], mode)
+    if stage == "bake":
+        return lambda: bake_team_color(bc, images["team"], mask, COLORS[0], COLORS[1], mode), pixels
+    if stage == "glow":
+        return lambda: generate_glow(output, images["glow"]), pixels
+    if stage == "badge":
+        badge = images["badge"]
+        return lambda: scale_alpha(badge, 128), badge.width * badge.height
+    if stage == "preview":
+        return lambda: PreviewCache().thumbnail("Result", output, PREVIEW_SIZE), pixels
+    if stage == "save":
+        glow_output = generate_glow(output, images["glow"]) if mode == HWRM else None
+        def save():
+            save_image(output, os.path.join(out_dir, "result.png"))
+            if glow_output is not None:
+                save_image(glow_output, os.path.join(out_dir, "result_glow.png"))
+        return save, pixels * (2 if glow_output is not None else 1)
+    raise ValueError(f"Unknown stage: {stage}")
+
+
+def prepare_case(paths, mode, stage, out_dir):
+    images = {name: load_texture(path) for name, path in paths.items()}
+    images["paths"] = paths
+    return stage_runner(stage, mode, images, out_dir)
+
+
+def memory_case(paths, mode, stage, out_dir):
+    # Peak RSS of one run, above what the loaded inputs already hold
+    run, pixels = prepare_case(paths, mode, stage, out_dir)
+    reset_peak_rss()
+    baseline = peak_rss()
+    run()
+    peak = peak_rss()
+    return {"peak_rss_bytes": peak, "peak_bytes": None if peak is None else max(0, peak - baseline)}
+
+
+def time_case(paths, size, mode, stage, repeat, out_dir):
+    run, pixels = prepare_case(paths, mode, stage, out_dir)
+    times = []
+    cpu = []
+    for _ in range(repeat):
+        start, start_cpu = time.perf_counter(), time.process_time()
+        run()
+        times.append(time.perf_counter() - start)
+        cpu.append(time.process_time() - start_cpu)
+    median = statistics.median(times)
+    return {
+        "size": size,
+        "mode": mode,
+        "stage": stage,
+        "repeat": repeat,
+        "seconds": median,
+        "best_seconds": min(times),
+        "cpu_seconds": statistics.median(cpu),
+        "megapixels": pixels / 1e6,
+        "megapixels_per_second": pixels / 1e6 / median if median else None,
+    }
+
+
+@contextmanager
+def unpooled_malloc():
+    # Inherited by spawned workers; other allocators ignore it
+    old = os.environ.get("MALLOC_MMAP_THRESHOLD_")
+    os.environ["MALLOC_MMAP_THRESHOLD_"] = "131072"
+    try:
+        yield
+    finally:
+        if old is None:
+            del os.environ["MALLOC_MMAP_THRESHOLD_"]
+        else:
+            os.environ["MALLOC_MMAP_THRESHOLD_"] = old
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment():
+    return {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "numpy": np.__version__,
+        "backend": BACKEND,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def run_benchmarks(sizes=SIZES, modes=(HW3, HWRM), stages=STAGES, repeat=3, report=None):
+    results = []
+    work_dir = tempfile.mkdtemp(prefix="hw_bench_")
+    # spawn: a clean interpreter per case, so nothing leaks between peak measurements
+    context = multiprocessing.get_context("spawn")
+    try:
+        for size in sizes:
+            paths = write_inputs(size, work_dir)
+            for mode in modes:
+                for stage in stages:
+                    if stage == "glow" and mode != HWRM:
+                        continue
+                    with context.Pool(1) as pool:
+                        result = pool.apply(time_case, (paths, size, mode, stage, repeat, work_dir))
+                    with unpooled_malloc(), context.Pool(1) as pool:
+                        result.update(pool.apply(memory_case, (paths, mode, stage, work_dir)))
+                    results.append(result)
+                    if report:
+                        report(result)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return {"environment": environment(), "results": results}
+
+
+def result_key(result):
+    return result["size"], result["mode"], result["stage"]
+
+
+def compare(baseline, current):
+    # Speedup of each case present in both runs (>1 is faster than the baseline)
+    before = {result_key(r): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = before.get(result_key(result))
+        if old and result["seconds"]:
+            rows.append((result, old["seconds"] / result["seconds"]))
+    return rows
+
+
+def save_results(data, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,189 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from bake_batch import ROLES
+from bake_io import ensure_parent
+
+# Content-addressed store of encoded bake outputs. The key hashes the input file
+# contents and every setting that changes the pixels; an entry is a directory
+# holding the result (and glow) files exactly as they were written, so a hit is
+# a file copy. Entry directory mtimes double as LRU timestamps.
+
+CACHE_VERSION = 2
+DEFAULT_CACHE_SIZE = 2 << 30
+HASHES_FILE = "hashes.json"
+META_FILE = "meta.json"
+
+
+def parse_size(value):
+    # "500M", "2G", "1.5g" or a plain byte count
+    text = str(value).strip().upper().rstrip("B")
+    units = {"K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+    scale = units.get(text[-1:], 1)
+    try:
+        return int(float(text[:-1] if scale > 1 else text) * scale)
+    except ValueError:
+        raise ValueError(f"Invalid size: {value}") from None
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FileHashes:
+    # Content hashes remembered by (size, mtime), so unchanged inputs are not re-read
+    def __init__(self, known=None):
+        self.known = known or {}
+        self.dirty = False
+
+    def hash(self, path):
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        known = self.known.get(path)
+        if known and known[0] == stat.st_size and known[1] == stat.st_mtime_ns:
+            return known[2]
+        digest = file_digest(path)
+        self.known[path] = [stat.st_size, stat.st_mtime_ns, digest]
+        self.dirty = True
+        return digest
+
+    def prune(self):
+        # Forget hashes of files that no longer exist
+        self.known = {path: known for path, known in self.known.items() if os.path.exists(path)}
+        return self.known
+
+
+def bake_key(hashes, texture_set, colors, mode, ext, glow=None, tiled=False):
+    inputs = {role: hashes.hash(texture_set[role]) for role in ROLES if role in texture_set}
+    # Badge placement, for sets that carry one; the image is keyed by content, not path
+    badge = dict(texture_set.get("badge") or {})
+    if "path" in badge:
+        badge["image"] = hashes.hash(badge.pop("path"))
+    settings = {
+        "version": CACHE_VERSION,
+        "inputs": inputs,
+        "colors": [list(colors[0]), list(colors[1])],
+        "mode": mode,
+        "glow": glow or {},
+        "badge": badge,
+        "ext": ext.lower(),
+        "tiled": bool(tiled),
+    }
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def read_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def write_json(data, path):
+    # Written aside and renamed, so an interrupted run never leaves half a file
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(path + ".tmp", path)
+
+
+class BakeCache:
+    def __init__(self, root, max_bytes=DEFAULT_CACHE_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(root, exist_ok=True)
+        self.hashes = FileHashes(read_json(os.path.join(root, HASHES_FILE), {}))
+
+    def key(self, texture_set, colors, mode, ext, glow=None, tiled=False):
+        return bake_key(self.hashes, texture_set, colors, mode, ext, glow, tiled)
+
+    def entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key, paths):
+        # Copies a cached entry to paths; returns the written files or None on a miss
+        entry = self.entry_dir(key)
+        try:
+            with open(os.path.join(entry, META_FILE), "r", encoding="utf-8") as f:
+                files = json.load(f)["files"]
+            written = []
+            for name, path in zip(files, paths):
+                source = os.path.join(entry, name)
+                if not same_file_state(source, path):
+                    ensure_parent(path)
+                    shutil.copy2(source, path)
+                written.append(path)
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return written
+
+    def store(self, key, written):
+        entry = self.entry_dir(key)
+        if os.path.isdir(entry):
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        staging = tempfile.mkdtemp(prefix=".tmp-", dir=os.path.dirname(entry))
+        try:
+            files = []
+            for i, path in enumerate(written):
+                name = ("result", "glow")[i] + os.path.splitext(path)[1]
+                shutil.copy2(path, os.path.join(staging, name))
+                files.append(name)
+            with open(os.path.join(staging, META_FILE), "w", encoding="utf-8") as f:
+                json.dump({"files": files, "stored": time.time()}, f)
+            # Another process may have stored the same key meanwhile; either copy is fine
+            os.rename(staging, entry)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def entries(self):
+        found = []
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_dir() and not entry.name.startswith("."):
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                    found.append((entry.stat().st_mtime, size, entry.path))
+        return found
+
+    def evict(self):
+        # Least recently used entries go first until the cache fits its cap
+        found = sorted(self.entries())
+        total = sum(size for used, size, path in found)
+        removed = 0
+        for used, size, path in found:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
+
+    def close(self):
+        if self.hashes.dirty:
+            write_json(self.hashes.prune(), os.path.join(self.root, HASHES_FILE))
+            self.hashes.dirty = False
+        return self.evict()
+
+
+def same_file_state(source, target):
+    # copy2 keeps mtimes, so an output restored earlier and left alone is not copied again
+    try:
+        a, b = os.stat(source), os.stat(target)
+    except OSError:
+        return False
+    return a.st_size == b.st_size and a.st_mtime_ns == b.st_mtime_ns
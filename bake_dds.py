@@ -0,0 +1,277 @@
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Block-compressed DDS straight from a baked image, with the full mip chain, so
+# game-ready textures need no separate conversion pass. The encoders work on
+# whole arrays of 4x4 blocks with NumPy, in chunks spread over threads.
+#
+# BC1 (DXT1): opaque RGB, 8 bytes a block. BC3 (DXT5): BC1 color plus an
+# interpolated alpha block. BC7: mode 6 only (one RGBA endpoint pair with
+# p-bits, 16 interpolation steps), which suits smooth texture detail and keeps
+# the encoder a single pass.
+#
+# Quality: "fast" takes endpoints from each block's bounding box, "balanced"
+# from its principal axis, "final" then refits them by least squares.
+
+DDS_FORMATS = ("auto", "bc1", "bc3", "bc7")
+QUALITIES = ("fast", "balanced", "final")
+BLOCK_BYTES = {"bc1": 8, "bc3": 16, "bc7": 16}
+CHUNK_BLOCKS = 4096
+# Encoder threads per process; pool workers lower it to their share of the cores
+ENCODE_THREADS = [os.cpu_count() or 1]
+DXGI_FORMAT_BC7_UNORM = 98
+BC7_WEIGHTS = (0, 4, 9, 13, 17, 21, 26, 30, 34, 38, 43, 47, 51, 55, 60, 64)
+# BC1 palette order: c0, c1, 2/3 c0 + 1/3 c1, 1/3 c0 + 2/3 c1, as thirds of c1,
+# and the palette index of each step from c0 to c1
+BC1_WEIGHTS = (0, 3, 1, 2)
+BC1_ORDER = (0, 2, 3, 1)
+
+
+def pick_format(image, dds_format="auto"):
+    if dds_format != "auto":
+        return dds_format
+    return "bc1" if image.mode != "RGBA" or image.getchannel("A").getextrema()[0] == 255 else "bc3"
+
+
+def mip_chain(image):
+    # Each level a 2x2 box average of the one above, down to 1x1
+    levels = [image]
+    while image.width > 1 or image.height > 1:
+        image = image.resize((max(1, image.width // 2), max(1, image.height // 2)), Image.Resampling.BOX)
+        levels.append(image)
+    return levels
+
+
+def to_blocks(image):
+    # (blocks, 16, 4) in row-major block order, edges padded by repeating the last row/column
+    pixels = np.asarray(image)
+    height, width = pixels.shape[:2]
+    pixels = np.pad(pixels, ((0, -height % 4), (0, -width % 4), (0, 0)), mode="edge")
+    rows, cols = pixels.shape[0] // 4, pixels.shape[1] // 4
+    return pixels.reshape(rows, 4, cols, 4, 4).transpose(0, 2, 1, 3, 4).reshape(-1, 16, 4)
+
+
+def principal_endpoints(points):
+    # Ends of each block's points projected on its principal axis (power iteration)
+    mean = points.mean(1)
+    centered = points - mean[:, None]
+    cov = np.einsum("nki,nkj->nij", centered, centered)
+    axis = cov[np.arange(len(cov)), :, np.argmax(np.einsum("nii->ni", cov), 1)]
+    for _ in range(4):
+        axis = np.einsum("nij,nj->ni", cov, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1, keepdims=True), 1e-9)
+    t = np.einsum("nki,ni->nk", centered, axis)
+    return mean + t.min(1)[:, None] * axis, mean + t.max(1)[:, None] * axis
+
+
+def endpoints(points, quality):
+    if quality == "fast":
+        return points.min(1), points.max(1)
+    return principal_endpoints(points)
+
+
+def nearest(points, palette):
+    # Index of the closest palette entry for every point; points (n, 16, c), palette (n, k, c)
+    diff = points[:, :, None, :] - palette[:, None, :, :]
+    return np.einsum("nkpc,nkpc->nkp", diff, diff).argmin(2)
+
+
+def project(points, start, end, positions):
+    # Index of the position (ascending fractions of start -> end) nearest each
+    # point's projection on that line: a cheaper stand-in for nearest()
+    line = (end - start).astype(np.float32)
+    t = np.einsum("nkc,nc->nk", points - start[:, None, :], line) / np.maximum((line * line).sum(1), 1)[:, None]
+    positions = np.array(positions, np.float32)
+    return np.searchsorted((positions[1:] + positions[:-1]) / 2, t)
+
+
+def refit(points, weights, steps):
+    # Least-squares endpoints for fixed indices: point = (1 - w) * e0 + w * e1
+    w = weights[:, :, None] / steps
+    a = ((1 - w) ** 2).sum(1)
+    b = ((1 - w) * w).sum(1)
+    c = (w ** 2).sum(1)
+    x = ((1 - w) * points).sum(1)
+    y = (w * points).sum(1)
+    det = a * c - b * b
+    ok = np.abs(det) > 1e-6
+    det = np.where(ok, det, 1)
+    e0 = np.where(ok, (c * x - b * y) / det, points.mean(1))
+    e1 = np.where(ok, (a * y - b * x) / det, points.mean(1))
+    return np.clip(e0, 0, 255), np.clip(e1, 0, 255)
+
+
+def pack565(color):
+    q = np.rint(color * [31 / 255, 63 / 255, 31 / 255]).astype(np.int32)
+    return (q[:, 0] << 11) | (q[:, 1] << 5) | q[:, 2]
+
+
+def unpack565(value):
+    r, g, b = value >> 11 & 31, value >> 5 & 63, value & 31
+    return np.stack([r << 3 | r >> 2, g << 2 | g >> 4, b << 3 | b >> 2], 1)
+
+
+def bc1_palette(c0, c1):
+    e0, e1 = unpack565(c0), unpack565(c1)
+    return np.stack([e0, e1, (2 * e0 + e1) // 3, (e0 + 2 * e1) // 3], 1)
+
+
+def bc1_fit(rgb, e0, e1, fast=False):
+    # Quantized endpoints (c0 > c1 for four-color mode), indices and squared error
+    c0, c1 = pack565(e0), pack565(e1)
+    swap = c0 < c1
+    c0, c1 = np.where(swap, c1, c0), np.where(swap, c0, c1)
+    palette = bc1_palette(c0, c1)
+    if fast:
+        index = np.array(BC1_ORDER)[project(rgb, palette[:, 0], palette[:, 1], (0, 1 / 3, 2 / 3, 1))]
+    else:
+        index = nearest(rgb, palette)
+    # Equal endpoints decode in three-color mode; index 0 is still the color
+    index[c0 == c1] = 0
+    picked = np.take_along_axis(palette, index[:, :, None], 1)
+    return c0, c1, index, ((rgb - picked) ** 2).sum((1, 2))
+
+
+def bc1_blocks(rgb, quality):
+    e0, e1 = endpoints(rgb, quality)
+    c0, c1, index, error = bc1_fit(rgb, e0, e1, quality == "fast")
+    if quality == "final":
+        for _ in range(2):
+            f0, f1 = refit(rgb, np.array(BC1_WEIGHTS)[index], 3)
+            r0, r1, rindex, rerror = bc1_fit(rgb, f0, f1)
+            better = rerror < error
+            c0, c1, error = np.where(better, r0, c0), np.where(better, r1, c1), np.minimum(error, rerror)
+            index = np.where(better[:, None], rindex, index)
+    out = np.zeros(len(rgb), np.dtype([("c0", "<u2"), ("c1", "<u2"), ("index", "<u4")]))
+    out["c0"], out["c1"] = c0, c1
+    out["index"] = (index.astype(np.uint32) << (2 * np.arange(16, dtype=np.uint32))).sum(1, dtype=np.uint32)
+    return out.view(np.uint8).reshape(-1, 8)
+
+
+def bc3_alpha_blocks(alpha):
+    # Eight-value mode: a0 > a1 and six interpolated steps between them
+    a0, a1 = alpha.max(1).astype(np.int32), alpha.min(1).astype(np.int32)
+    steps = np.arange(1, 7)
+    between = ((7 - steps) * a0[:, None] + steps * a1[:, None] + 3) // 7
+    palette = np.concatenate([a0[:, None], a1[:, None], between], 1)
+    index = np.abs(alpha[:, :, None] - palette[:, None, :]).argmin(2).astype(np.uint64)
+    index[a0 == a1] = 0
+    bits = (index << (3 * np.arange(16, dtype=np.uint64))).sum(1, dtype=np.uint64)
+    out = np.zeros((len(alpha), 8), np.uint8)
+    out[:, 0], out[:, 1] = a0, a1
+    out[:, 2:] = bits.astype("<u8").view(np.uint8).reshape(-1, 8)[:, :6]
+    return out
+
+
+def bc3_blocks(rgba, quality):
+    return np.concatenate([bc3_alpha_blocks(rgba[:, :, 3]), bc1_blocks(rgba[:, :, :3], quality)], 1)
+
+
+def bc7_quantize(e):
+    # 7-bit endpoint plus a shared p-bit, whichever p reproduces the endpoint best
+    best = None
+    for p in (0, 1):
+        q = np.clip(np.rint((e - p) / 2), 0, 127).astype(np.int32)
+        error = (((q * 2 + p) - e) ** 2).sum(1)
+        if best is None:
+            best = (q, np.zeros(len(e), np.int32), error)
+        else:
+            better = error < best[2]
+            best = (np.where(better[:, None], q, best[0]), np.where(better, 1, best[1]), np.minimum(error, best[2]))
+    return best[0], best[1]
+
+
+def bc7_fit(rgba, e0, e1, fast=False):
+    q0, p0 = bc7_quantize(e0)
+    q1, p1 = bc7_quantize(e1)
+    full0, full1 = q0 * 2 + p0[:, None], q1 * 2 + p1[:, None]
+    w = np.array(BC7_WEIGHTS)[None, :, None]
+    palette = ((64 - w) * full0[:, None, :] + w * full1[:, None, :] + 32) >> 6
+    if fast:
+        index = project(rgba, full0, full1, [w / 64 for w in BC7_WEIGHTS])
+    else:
+        index = nearest(rgba, palette)
+    picked = np.take_along_axis(palette, index[:, :, None], 1)
+    return (q0, p0, q1, p1), index, ((rgba - picked) ** 2).sum((1, 2))
+
+
+def bc7_blocks(rgba, quality):
+    e0, e1 = endpoints(rgba, quality)
+    fit, index, error = bc7_fit(rgba, e0, e1, quality == "fast")
+    if quality == "final":
+        for _ in range(2):
+            refit_fit, refit_index, refit_error = bc7_fit(rgba, *refit(rgba, np.array(BC7_WEIGHTS)[index], 64))
+            better = refit_error < error
+            fit = tuple(np.where(better.reshape((-1,) + (1,) * (a.ndim - 1)), b, a) for a, b in zip(fit, refit_fit))
+            index = np.where(better[:, None], refit_index, index)
+            error = np.minimum(error, refit_error)
+    q0, p0, q1, p1 = fit
+    # The first index is stored in 3 bits: flip the endpoints where it would need 4
+    flip = index[:, 0] >= 8
+    q0, q1 = np.where(flip[:, None], q1, q0), np.where(flip[:, None], q0, q1)
+    p0, p1 = np.where(flip, p1, p0), np.where(flip, p0, p1)
+    index = np.where(flip[:, None], 15 - index, index).astype(np.uint64)
+    q0, q1 = q0.astype(np.uint64), q1.astype(np.uint64)
+    # Mode 6: bit 6 set, then R0 R1 G0 G1 B0 B1 A0 A1 (7 bits each), P0, P1, indices
+    lo = np.full(len(rgba), 1 << 6, np.uint64)
+    for c in range(4):
+        lo |= q0[:, c] << np.uint64(7 + 14 * c)
+        lo |= q1[:, c] << np.uint64(14 + 14 * c)
+    lo |= p0.astype(np.uint64) << np.uint64(63)
+    hi = p1.astype(np.uint64) | index[:, 0] << np.uint64(1)
+    hi |= (index[:, 1:] << (4 * np.arange(1, 16, dtype=np.uint64))).sum(1, dtype=np.uint64)
+    return np.stack([lo, hi], 1).astype("<u8").view(np.uint8).reshape(-1, 16)
+
+
+ENCODERS = {"bc1": lambda rgba, quality: bc1_blocks(rgba[:, :, :3], quality), "bc3": bc3_blocks, "bc7": bc7_blocks}
+
+
+def encode_level(image, dds_format, quality, pool):
+    blocks = to_blocks(image)
+    encode = ENCODERS[dds_format]
+    chunks = pool.map(lambda start: encode(blocks[start:start + CHUNK_BLOCKS].astype(np.float32), quality),
+                      range(0, len(blocks), CHUNK_BLOCKS))
+    return b"".join(chunk.tobytes() for chunk in chunks)
+
+
+def set_encode_threads(count):
+    ENCODE_THREADS[0] = max(1, count)
+
+
+def dds_header(size, dds_format, levels, top_bytes):
+    # DDSD_CAPS | HEIGHT | WIDTH | PIXELFORMAT | MIPMAPCOUNT | LINEARSIZE
+    flags = 0x1 | 0x2 | 0x4 | 0x1000 | 0x20000 | 0x80000
+    fourcc = {"bc1": b"DXT1", "bc3": b"DXT5", "bc7": b"DX10"}[dds_format]
+    pixel_format = struct.pack("<II4s5I", 32, 0x4, fourcc, 0, 0, 0, 0, 0)
+    # DDSCAPS_TEXTURE, plus COMPLEX | MIPMAP with a mip chain
+    caps = 0x1000 | (0x400008 if levels > 1 else 0)
+    header = struct.pack("<7I44x", 124, flags, size[1], size[0], top_bytes, 0, levels)
+    header = b"DDS " + header + pixel_format + struct.pack("<5I", caps, 0, 0, 0, 0)
+    if dds_format == "bc7":
+        # DX10 extension: DXGI format, 2D texture, no flags, array size 1
+        header += struct.pack("<5I", DXGI_FORMAT_BC7_UNORM, 3, 0, 1, 0)
+    return header
+
+
+def write_dds(image, path, dds_format="auto", quality="balanced", mipmaps=True, threads=None):
+    image = image if image.mode == "RGBA" else image.convert("RGBA")
+    dds_format = pick_format(image, dds_format)
+    if dds_format not in BLOCK_BYTES:
+        raise ValueError(f"Unknown DDS format: {dds_format} (choose from {', '.join(DDS_FORMATS)})")
+    if quality not in QUALITIES:
+        raise ValueError(f"Unknown DDS quality: {quality} (choose from {', '.join(QUALITIES)})")
+    levels = mip_chain(image) if mipmaps else [image]
+    with ThreadPoolExecutor(threads or ENCODE_THREADS[0]) as pool:
+        data = [encode_level(level, dds_format, quality, pool) for level in levels]
+    with open(path, "wb") as f:
+        f.write(dds_header(image.size, dds_format, len(levels), len(data[0])))
+        for level in data:
+            f.write(level)
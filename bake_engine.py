@@ -0,0 +1,487 @@
+import os
+import re
+
+from PIL import Image, ImageChops, ImageFilter, ImageMath
+
+from bake_io import select_bands
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+HW3 = "Homeworld 3"
+HWRM = "Homeworld Remastered"
+MODES = (HW3, HWRM)
+
+STRIP_ROWS = 256
+BAKE_RUN = 1 << 18
+
+
+def build_color_tables(color1, color2):
+    # Every colored channel depends only on (TEAM red, BC channel), so the
+    # lerp and the 0.75/0.25 modulation collapse into one 256x256 table each.
+    t = np.arange(256) / 255.0
+    modulation = np.arange(256) / 255 * 0.75 + 0.25
+    tables = []
+    for c in range(3):
+        team = (color1[c] * (1 - t) + color2[c] * t).astype(np.uint8)
+        tables.append((team[:, None] * modulation[None, :]).astype(np.uint8).ravel())
+    return tables
+
+
+def plane(image, band):
+    return np.asarray(image.getchannel(band))
+
+
+def effective_alpha(team_r, team_g, team_b, mask_a, mode):
+    # Mask alpha with the HWRM yellow regions forced to 0; None means 255 everywhere.
+    # 0 and 255 map to factors of exactly 0.0 and 1.0, so this matches the float factor.
+    alpha = mask_a
+    if mode == HWRM:
+        yellow = (team_r > 240) & (team_g > 240) & (team_b < 20)
+        if yellow.any():
+            alpha = np.full(team_r.shape, 255, np.uint8) if alpha is None else alpha.copy()
+            alpha[yellow] = 0
+    return alpha
+
+
+def blend(bc, bc_term, colored, alpha, a16, partial=None):
+    # int(bc * (1 - a / 255.0) + colored * a / 255.0) in integers; bc_term is bc * (255 - a)
+    v = colored * a16
+    v += bc_term
+    q = v + 1
+    q += v >> 8
+    q >>= 8
+    out = q.astype(np.uint8)
+    # On exact multiples of 255 the float form can round down by one; redo those few in float
+    exact = q * 255 == v
+    if partial is not None:
+        exact &= partial
+    exact = np.flatnonzero(exact)
+    if exact.size:
+        f = alpha[exact] / 255.0
+        out[exact] = (bc[exact] * (1 - f) + colored[exact] * f).astype(np.uint8)
+    return out
+
+
+def as_rgba(image, size=None, resample=None, cache=None):
+    # cache: a ResampleCache that keeps the resized copy for the next bake
+    if image.mode != "RGBA":
+        image = image.convert("RGBA")
+    if size is not None and image.size != size:
+        image = cache.resized(image, size, resample) if cache is not None else image.resize(size, resample)
+    return image
+
+
+class PreparedBake:
+    # Everything in the bake that does not depend on color1/color2: the TEAM weight
+    # and BC modulation (as table indices), and the mask/yellow factor. bake() is
+    # then a table lookup plus the blend, cheap enough to run once per preset.
+    def __init__(self, bc_image, team_image, mask_image, mode):
+        bc_image = as_rgba(bc_image)
+        self.size = size = bc_image.size
+        team_image = as_rgba(team_image, size)
+        self.bc_alpha = bc_image.getchannel("A")
+        self.bc = [plane(bc_image, band) for band in "RGB"]
+        team_r = plane(team_image, "R")
+        mask_a = plane(as_rgba(mask_image, size), "A") if mask_image is not None else None
+        if mode == HWRM:
+            mask_a = effective_alpha(team_r, plane(team_image, "G"), plane(team_image, "B"), mask_a, mode)
+        weight = team_r.astype(np.uint16) << 8
+        self.index = [(weight | bc).ravel() for bc in self.bc]
+        # (start, end) runs of flat pixels baked at a time, so the lookup, copy and
+        # blend temporaries of a run stay in cache
+        pixels = size[0] * size[1]
+        self.runs = [(start, min(pixels, start + BAKE_RUN)) for start in range(0, pixels, BAKE_RUN)]
+        self.partial = None
+        self.blended = False
+        self.untouched = None
+        self.lit = None
+        if mask_a is None:
+            return
+        untouched = mask_a == 0
+        if untouched.any():
+            # Untouched pixels keep the BC: 0xFF bytes that select it over the lookup
+            # without branching, so the index can stay uint16
+            self.untouched = untouched.ravel().view(np.uint8) * np.uint8(255)
+        partial = ((mask_a - np.uint8(1)) < 254).ravel()
+        count = np.count_nonzero(partial)
+        if not count:
+            return
+        if count * 2 > partial.size:
+            # Mostly soft mask: blend every pixel in place
+            self.partial = None
+            self.dense_partial = partial
+            self.alpha = mask_a.ravel()
+            self.packed_runs = self.runs
+        else:
+            # Only pixels with 0 < alpha < 255 need blending; keep them packed
+            self.partial = np.flatnonzero(partial)
+            self.dense_partial = None
+            self.alpha = mask_a.ravel()[self.partial]
+            # The packed pixels of each run
+            self.packed_runs = list(zip(np.searchsorted(self.partial, [start for start, end in self.runs]),
+                                        np.searchsorted(self.partial, [end for start, end in self.runs])))
+        self.blended = True
+        self.a16 = self.alpha.astype(np.uint16)
+        self.bc_partial = [bc.ravel()[self.partial] if self.partial is not None else bc.ravel() for bc in self.bc]
+        self.bc_term = [bc * (255 - self.a16) for bc in self.bc_partial]
+
+    def bake_channel(self, c, table):
+        index = self.index[c]
+        colored = np.empty(index.size, np.uint8)
+        bc = self.bc[c].ravel()
+        for run, (start, end) in enumerate(self.runs):
+            out = colored[start:end]
+            np.take(table, index[start:end], out=out)
+            if self.untouched is not None:
+                keep = bc[start:end] ^ out
+                keep &= self.untouched[start:end]
+                out ^= keep
+            if self.blended:
+                low, high = self.packed_runs[run]
+                where = slice(start, end) if self.partial is None else self.partial[low:high]
+                colored[where] = blend(self.bc_partial[c][low:high], self.bc_term[c][low:high], colored[where],
+                                       self.alpha[low:high], self.a16[low:high],
+                                       self.dense_partial[low:high] if self.partial is None else None)
+        return colored.reshape(self.size[1], self.size[0])
+
+    def bake_planes(self, color1, color2):
+        tables = build_color_tables(color1, color2)
+        return [self.bake_channel(c, tables[c]) for c in range(3)]
+
+    def bake(self, color1, color2):
+        return Image.merge("RGBA", [Image.fromarray(p, "L") for p in self.bake_planes(color1, color2)] + [self.bc_alpha])
+
+    def bake_glow(self, color1, color2, lit):
+        # The glow output straight from the baked planes: one masked pass that
+        # zeroes the color where lit is 0, instead of apply_glow on the merged image
+        planes = self.bake_planes(color1, color2)
+        output = Image.merge("RGBA", [Image.fromarray(p, "L") for p in planes] + [self.bc_alpha])
+        keep = self.glow_keep(lit)
+        return output, Image.merge("RGBA", [Image.fromarray(p & keep, "L") for p in planes] + [lit])
+
+    def glow_keep(self, lit):
+        # 0xFF bytes where lit is nonzero; lit does not depend on color, so a batch
+        # passes the same image for every faction and this runs once
+        if self.lit is not lit:
+            self.lit = lit
+            self.keep = (np.asarray(lit) != 0).view(np.uint8) * np.uint8(255)
+        return self.keep
+
+
+# Lookup table rows by team color: int(color * modulation) for every BC value, filled on first use
+MODULATED_ROWS = [None] * 256
+FACTORS = [a / 255.0 for a in range(256)]
+
+
+def modulated_row(color):
+    row = MODULATED_ROWS[color]
+    if row is None:
+        row = MODULATED_ROWS[color] = bytes(int(color * (v / 255 * 0.75 + 0.25)) for v in range(256))
+    return row
+
+
+def color_table(c1, c2):
+    # 65536 entries indexed by (TEAM red << 8 | BC channel), same float steps as build_color_tables
+    return b"".join(modulated_row(int(c1 * (1 - t / 255.0) + c2 * (t / 255.0))) for t in range(256))
+
+
+# unsafe_eval is the string form since Pillow 10.3; the expressions here are constants
+image_math = getattr(ImageMath, "unsafe_eval", None) or ImageMath.eval
+
+
+def index_band(team_r, band):
+    # TEAM red << 8 | band as an "I" image: the two bytes of a little-endian I;16 pixel
+    pairs = Image.merge("LA", (band, team_r)).tobytes()
+    return Image.frombytes("I;16", band.size, pairs).convert("I")
+
+
+def threshold(band, test):
+    return band.point([255 if test(v) else 0 for v in range(256)])
+
+
+def soft_blend(bc, colored, alpha, partial):
+    # int(bc * (1 - a / 255.0) + colored * a / 255.0): the integer floor is exact
+    # except on some exact multiples of 255, where the float form rounds down by
+    # one; those few pixels are redone in float
+    v = image_math("b * (255 - a) + c * a", a=alpha, b=bc, c=colored)
+    out = image_math("v / 255", v=v).convert("L")
+    exact = image_math("(v % 255 == 0) * p", v=v, p=partial).convert("L").tobytes()
+    if b"\x01" not in exact:
+        return out
+    pixels = bytearray(out.tobytes())
+    bc_bytes, colored_bytes, alpha_bytes = bc.tobytes(), colored.tobytes(), alpha.tobytes()
+    for match in re.finditer(b"\x01", exact):
+        i = match.start()
+        f = FACTORS[alpha_bytes[i]]
+        pixels[i] = int(bc_bytes[i] * (1 - f) + colored_bytes[i] * f)
+    return Image.frombytes("L", out.size, bytes(pixels))
+
+
+class PillowBake:
+    # PreparedBake for machines without NumPy, on Pillow primitives only. Each
+    # colored channel is one 65536-entry point() lookup of (TEAM red, BC channel);
+    # a 0/255 mask is a composite, a soft one an integer ImageMath blend.
+    def __init__(self, bc_image, team_image, mask_image, mode):
+        bc_image = as_rgba(bc_image)
+        self.size = size = bc_image.size
+        team_image = as_rgba(team_image, size)
+        self.bc_alpha = bc_image.getchannel("A")
+        self.bc = bc_image.split()[:3]
+        team_r = team_image.getchannel("R")
+        self.index = [index_band(team_r, band) for band in self.bc]
+        alpha = as_rgba(mask_image, size).getchannel("A") if mask_image is not None else None
+        if mode == HWRM:
+            yellow = ImageChops.multiply(ImageChops.multiply(threshold(team_r, lambda v: v > 240),
+                                                             threshold(team_image.getchannel("G"), lambda v: v > 240)),
+                                         threshold(team_image.getchannel("B"), lambda v: v < 20))
+            if yellow.getbbox():
+                alpha = ImageChops.subtract(alpha if alpha is not None else Image.new("L", size, 255), yellow)
+        self.alpha = alpha
+        # 1 where the mask is neither 0 nor 255, None for a 0/255 mask
+        self.partial = None
+        if alpha is not None and any(alpha.histogram()[1:255]):
+            self.partial = alpha.point([0] + [1] * 254 + [0])
+
+    def bake(self, color1, color2):
+        bands = []
+        for c in range(3):
+            colored = self.index[c].point(color_table(color1[c], color2[c]), "L")
+            if self.alpha is not None:
+                if self.partial is not None:
+                    colored = soft_blend(self.bc[c], colored, self.alpha, self.partial)
+                else:
+                    colored = Image.composite(colored, self.bc[c], self.alpha)
+            bands.append(colored)
+        return Image.merge("RGBA", bands + [self.bc_alpha])
+
+
+def fused_bake(bc, team_r, alpha, has_alpha, tables, lit, keep, has_lit, out, glow):
+    # The whole per-faction bake in one pass over the pixels, rows spread over
+    # threads: table lookup, mask/yellow blend with the float form of the
+    # original loop, and the glow output, the color ANDed with keep (0xFF where
+    # lit is nonzero) so every pixel is written without a branch
+    height, width = team_r.shape
+    for y in numba.prange(height):
+        for x in range(width):
+            a = alpha[y, x] if has_alpha else 255
+            row = np.int64(team_r[y, x]) << 8
+            for c in range(3):
+                b = bc[y, x, c]
+                if a == 0:
+                    out[y, x, c] = b
+                elif a == 255:
+                    out[y, x, c] = tables[c, row + b]
+                else:
+                    f = a / 255.0
+                    out[y, x, c] = np.uint8(int(b * (1 - f) + tables[c, row + b] * f))
+            out[y, x, 3] = bc[y, x, 3]
+            if has_lit:
+                for c in range(3):
+                    glow[y, x, c] = out[y, x, c] & keep[y, x]
+                glow[y, x, 3] = lit[y, x]
+
+
+if numba is not None:
+    # Compiled on first use; cache=True keeps the machine code between runs
+    fused_bake = numba.njit(parallel=True, cache=True)(fused_bake)
+
+
+def set_kernel_threads(count):
+    # Row threads of the JIT kernel; pool workers split the cores between them
+    if numba is not None:
+        numba.set_num_threads(max(1, min(count, numba.config.NUMBA_NUM_THREADS)))
+
+
+class JitBake:
+    # PreparedBake as one compiled kernel (needs numba): no full-size temporaries
+    # per faction, which matters once 8K atlases make the bake memory bound.
+    # bake_glow() also writes the glow output in the same pass.
+    def __init__(self, bc_image, team_image, mask_image, mode):
+        bc_image = as_rgba(bc_image)
+        self.size = size = bc_image.size
+        team_image = as_rgba(team_image, size)
+        self.bc = np.asarray(bc_image)
+        self.team_r = plane(team_image, "R")
+        alpha = plane(as_rgba(mask_image, size), "A") if mask_image is not None else None
+        if mode == HWRM:
+            alpha = effective_alpha(self.team_r, plane(team_image, "G"), plane(team_image, "B"), alpha, mode)
+        self.alpha = alpha
+        self.lit = None
+
+    def run(self, color1, color2, lit=None, keep=None):
+        out = np.empty(self.bc.shape, np.uint8)
+        glow = np.empty(self.bc.shape, np.uint8) if lit is not None else out
+        # Absent planes are passed as a 1x1 stand-in so the kernel compiles once
+        unused = self.team_r[:1, :1]
+        fused_bake(self.bc, self.team_r, self.alpha if self.alpha is not None else unused, self.alpha is not None,
+                   np.stack(build_color_tables(color1, color2)), lit if lit is not None else unused,
+                   keep if keep is not None else unused, lit is not None, out, glow)
+        return out, glow
+
+    def bake(self, color1, color2):
+        return Image.fromarray(self.run(color1, color2)[0], "RGBA")
+
+    def bake_glow(self, color1, color2, lit):
+        # The lit and keep planes are made once for all factions
+        if self.lit is not lit:
+            self.lit, self.lit_plane = lit, np.asarray(lit)
+            self.keep = (self.lit_plane != 0).view(np.uint8) * np.uint8(255)
+        out, glow = self.run(color1, color2, self.lit_plane, self.keep)
+        return Image.fromarray(out, "RGBA"), Image.fromarray(glow, "RGBA")
+
+
+# Bake backends by name, fastest first; all share the PreparedBake interface.
+# HW_BAKE_BACKEND picks one explicitly, otherwise the fastest installed is used.
+BACKENDS = {}
+if numba is not None:
+    BACKENDS["jit"] = JitBake
+if np is not None:
+    BACKENDS["numpy"] = PreparedBake
+BACKENDS["pillow"] = PillowBake
+BACKEND = os.environ.get("HW_BAKE_BACKEND", "")
+if BACKEND not in BACKENDS:
+    BACKEND = next(iter(BACKENDS))
+PreparedBake = BACKENDS[BACKEND]
+
+
+def bake_glow(prepared, color1, color2, lit):
+    # (output, glow output); the jit and numpy backends make the glow from their baked planes
+    if hasattr(prepared, "bake_glow"):
+        return prepared.bake_glow(color1, color2, lit)
+    output = prepared.bake(color1, color2)
+    return output, apply_glow(output, lit)
+
+
+def bake_team_color(bc_image, team_image, mask_image, color1, color2, mode):
+    return PreparedBake(bc_image, team_image, mask_image, mode).bake(color1, color2)
+
+
+class BakeCancelled(Exception):
+    pass
+
+
+def bake_team_color_strips(bc_image, team_image, mask_image, color1, color2, mode, rows=STRIP_ROWS, progress=None,
+                           lit=None):
+    # Same result as bake_team_color, baked a strip at a time so progress(done_rows,
+    # total_rows) can report between strips, or raise BakeCancelled to stop the bake.
+    # With a glow_mask lit, returns (output, glow output) made by bake_glow per strip.
+    bc_image = as_rgba(bc_image)
+    width, height = size = bc_image.size
+    team_image = as_rgba(team_image, size)
+    mask_image = as_rgba(mask_image, size) if mask_image is not None else None
+    output = Image.new("RGBA", size)
+    glow_output = Image.new("RGBA", size) if lit is not None else None
+    for top in range(0, height, rows):
+        box = (0, top, width, min(height, top + rows))
+        mask_strip = mask_image.crop(box) if mask_image is not None else None
+        prepared = PreparedBake(bc_image.crop(box), team_image.crop(box), mask_strip, mode)
+        if lit is None:
+            output.paste(prepared.bake(color1, color2), box[:2])
+        else:
+            strip, glow_strip = bake_glow(prepared, color1, color2, lit.crop(box))
+            output.paste(strip, box[:2])
+            glow_output.paste(glow_strip, box[:2])
+        if progress:
+            progress(box[3], height)
+    return output if lit is None else (output, glow_output)
+
+
+GLOW_LEVEL = 128
+NONZERO = [0] + [255] * 255
+
+
+def glow_threshold(softness=0):
+    # Hard cut at green > 128, or a linear ramp `softness` levels wide on each side of it
+    if softness <= 0:
+        return [255 if v > GLOW_LEVEL else 0 for v in range(256)]
+    low, high = GLOW_LEVEL - softness, GLOW_LEVEL + softness
+    return [min(255, max(0, round((v - low) * 255 / (high - low)))) for v in range(256)]
+
+
+def glow_green(glow_image, size, cache=None):
+    # LANCZOS-resized GLOW green band. Only G (opaque maps) or G and A are
+    # resized; as LA the premultiplied resize gives the same G as the full RGBA one.
+    glow_image = as_rgba(glow_image)
+    if glow_image.size == size:
+        return glow_image.getchannel("G")
+    bands = "G" if glow_image.getchannel("A").getextrema() == (255, 255) else "GA"
+    if cache is not None:
+        resized = cache.resized(glow_image, size, Image.Resampling.LANCZOS, bands)
+    else:
+        resized = select_bands(glow_image, bands).resize(size, Image.Resampling.LANCZOS)
+    return resized.getchannel(0) if bands == "GA" else resized
+
+
+def glow_mask(glow_image, size, softness=0, feather=0, cache=None):
+    # Coverage of the glow output; independent of the team colors
+    lit = glow_green(glow_image, size, cache).point(glow_threshold(softness))
+    if feather > 0:
+        lit = lit.filter(ImageFilter.GaussianBlur(feather))
+    return lit
+
+
+def apply_glow(output_image, lit):
+    # Output color with the coverage as alpha; uncovered pixels stay (0, 0, 0, 0)
+    glow = Image.composite(output_image, Image.new("RGBA", output_image.size), lit.point(NONZERO))
+    glow.putalpha(lit)
+    return glow
+
+
+def generate_glow(output_image, glow_image, softness=0, feather=0, cache=None):
+    return apply_glow(output_image, glow_mask(glow_image, output_image.size, softness, feather, cache))
+
+
+def scale_alpha(image, alpha):
+    # Badge transparency: a -> int(a * alpha / 255) through a lookup on the alpha band
+    if alpha >= 255:
+        return image
+    factor = alpha / 255.0
+    scaled = image.copy()
+    scaled.putalpha(image.getchannel("A").point([int(a * factor) for a in range(256)]))
+    return scaled
+
+
+def transform_badge(badge, size, rotation=0, alpha=255, resample=Image.Resampling.LANCZOS):
+    return scale_alpha(badge.rotate(rotation, expand=False).resize(size, resample), alpha)
+
+
+def place_badge(output, badge, placement):
+    # placement: {"x", "y", "width", "height"} in output pixels, plus optional "rotation" and "alpha"
+    size = (int(placement["width"]), int(placement["height"]))
+    placed = transform_badge(badge, size, placement.get("rotation", 0), placement.get("alpha", 255))
+    output.paste(placed, (int(placement["x"]), int(placement["y"])), placed)
+    return output
+
+
+DRAFT_SIZE = 512
+
+
+class DraftBake:
+    # Downsampled, color independent state for interactive previews: a color change
+    # is then a PreparedBake.bake() on a few hundred thousand pixels
+    def __init__(self, bc_image, team_image, mask_image, glow_image, mode, glow=None, max_side=DRAFT_SIZE, cache=None):
+        bc_image = as_rgba(bc_image)
+        scale = min(1.0, max_side / max(bc_image.size))
+        size = (max(1, round(bc_image.width * scale)), max(1, round(bc_image.height * scale)))
+        def small(image):
+            return as_rgba(image, size, Image.Resampling.BOX, cache) if image is not None else None
+        self.size = size
+        self.prepared = PreparedBake(small(bc_image), small(team_image), small(mask_image), mode)
+        self.lit = None
+        if mode == HWRM and glow_image is not None:
+            glow = dict(glow or {})
+            glow["feather"] = glow.get("feather", 0) * scale
+            self.lit = glow_mask(small(glow_image), size, **glow)
+
+    def bake(self, color1, color2):
+        if self.lit is None:
+            return self.prepared.bake(color1, color2), None
+        return bake_glow(self.prepared, color1, color2, self.lit)
@@ -0,0 +1,206 @@
+import os
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+
+from PIL import Image, __version__ as PILLOW_VERSION
+
+from bake_dds import pick_format, write_dds
+from bake_png import np, write_png
+
+TEXTURE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".bmpp", ".tga", ".dds", ".tiff", ".tif", ".gif", ".webp")
+TEXTURE_CACHE_BYTES = 1 << 30
+RESAMPLE_CACHE_BYTES = 1 << 30
+# PNG zlib level and strategy by preset: "fast" while iterating on a ship,
+# "final" for the smallest files when shipping the mod
+ENCODE_PRESETS = {
+    "fast": (1, zlib.Z_DEFAULT_STRATEGY),
+    "balanced": (6, zlib.Z_DEFAULT_STRATEGY),
+    "final": (9, zlib.Z_DEFAULT_STRATEGY),
+}
+# PNGs from this many pixels up are deflated in strips on several threads
+PARALLEL_PNG_PIXELS = 2048 * 2048
+# Pillow writes BC1/BC3 DDS from 11.2; older releases ignore pixel_format and save uncompressed
+PILLOW_DDS_WRITE = (11, 2)
+
+
+def decode_texture(path):
+    with Image.open(path) as image:
+        return image.convert("RGBA")
+
+
+def image_bytes(image):
+    return image.width * image.height * len(image.getbands())
+
+
+class TextureCache:
+    # Decoded RGBA textures by (path, size, mtime), least recently used first, up
+    # to max_bytes of pixels. Callers share the cached images and must not modify
+    # them in place.
+    def __init__(self, max_bytes=TEXTURE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, decode):
+        with self.lock:
+            image = self.entries.pop(key, None)
+            if image is not None:
+                self.entries[key] = image
+                self.hits += 1
+                return image
+            self.misses += 1
+        # Decoded outside the lock so a slow file doesn't hold up other loads
+        image = decode()
+        size = image_bytes(image)
+        with self.lock:
+            if size <= self.max_bytes and key not in self.entries:
+                self.entries[key] = image
+                self.bytes += size
+                self.trim()
+        return image
+
+    def load(self, path):
+        stat = os.stat(path)
+        return self.get((os.path.abspath(path), stat.st_size, stat.st_mtime_ns), lambda: decode_texture(path))
+
+    def trim(self):
+        while self.bytes > self.max_bytes and self.entries:
+            key, image = self.entries.popitem(last=False)
+            self.bytes -= image_bytes(image)
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        with self.lock:
+            self.max_bytes = max_bytes
+            self.trim()
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self.entries), "bytes": self.bytes, "max_bytes": self.max_bytes}
+
+
+def select_bands(image, bands=None):
+    # None: the image itself; one band name: that band as L; two: those bands as
+    # LA, which Pillow resizes with premultiplied alpha exactly like RGBA
+    if not bands:
+        return image
+    if len(bands) == 1:
+        return image.getchannel(bands)
+    return Image.merge("LA", [image.getchannel(band) for band in bands])
+
+
+class SourceKey:
+    # Dict key for a source image by identity (images compare by content). Only a
+    # weak reference is kept, so a cached resize never keeps its full-size source
+    # alive; on_dead runs once the source is freed
+    def __init__(self, value, on_dead=None):
+        self.ref = weakref.ref(value, on_dead)
+        self.hash = id(value)
+
+    def __hash__(self):
+        return self.hash
+
+    def __eq__(self, other):
+        return isinstance(other, SourceKey) and other.ref() is not None and other.ref() is self.ref()
+
+
+class ResampleCache(TextureCache):
+    # Resized copies by (source image, target size, filter[, bands]): a TEAM, MASK
+    # or GLOW whose size differs from the BC is resized once and reused across
+    # bakes and presets, and the source image itself is never replaced. Entries
+    # go when their source is freed or dropped with retain()
+    def __init__(self, max_bytes=RESAMPLE_CACHE_BYTES):
+        super().__init__(max_bytes)
+        # Set from weakref callbacks, which may run inside a locked section;
+        # the entries are removed on the next call instead
+        self.dead = False
+
+    def source_freed(self, ref):
+        self.dead = True
+
+    def resized(self, image, size, resample=None, bands=None):
+        if image.size == size:
+            return select_bands(image, bands)
+        self.purge()
+        return self.get((SourceKey(image, self.source_freed), size, resample, bands),
+                        lambda: select_bands(image, bands).resize(size, resample))
+
+    def drop(self, keep):
+        # Under the lock: remove entries whose source is freed or fails keep(source)
+        for key in [key for key in self.entries if key[0].ref() is None or not keep(key[0].ref())]:
+            self.bytes -= image_bytes(self.entries.pop(key))
+
+    def purge(self):
+        if self.dead:
+            with self.lock:
+                self.dead = False
+                self.drop(lambda source: True)
+
+    def retain(self, images):
+        # Forget the resizes of every source but these (e.g. after loading new textures)
+        ids = {id(image) for image in images if image is not None}
+        with self.lock:
+            self.dead = False
+            self.drop(lambda source: id(source) in ids)
+
+    def stats(self):
+        self.purge()
+        return super().stats()
+
+
+# Shared by everything in this process that passes them to load_texture / the bake
+texture_cache = TextureCache()
+resample_cache = ResampleCache(RESAMPLE_CACHE_BYTES)
+
+
+def load_texture(path, cache=None):
+    return cache.load(path) if cache is not None else decode_texture(path)
+
+
+def ensure_parent(path):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+
+def save_dds(image, path, encode=None, dds_format="auto"):
+    # Block compressed with mipmaps; without NumPy, Pillow's BC1/BC3 encoder
+    # writes the top level only
+    if np is not None:
+        write_dds(image, path, dds_format, encode or "balanced")
+        return
+    dds_format = pick_format(image, dds_format)
+    if dds_format == "bc7":
+        raise ValueError("BC7 output needs NumPy")
+    if tuple(int(part) for part in PILLOW_VERSION.split(".")[:2]) < PILLOW_DDS_WRITE:
+        raise ValueError(f"DDS output needs NumPy or Pillow 11.2+ (found Pillow {PILLOW_VERSION})")
+    image.save(path, pixel_format={"bc1": "DXT1", "bc3": "DXT5"}[dds_format])
+
+
+def save_image(image, path, encode=None, dds_format="auto"):
+    # encode: an ENCODE_PRESETS name, the zlib level of PNGs and the block
+    # encoder quality of DDS; None keeps Pillow's PNG defaults
+    ensure_parent(path)
+    if os.path.splitext(path)[1].lower() == ".dds":
+        save_dds(image, path, encode, dds_format)
+        return
+    if encode is None or os.path.splitext(path)[1].lower() != ".png":
+        image.save(path)
+        return
+    level, strategy = ENCODE_PRESETS[encode]
+    if np is not None and image.width * image.height >= PARALLEL_PNG_PIXELS:
+        write_png(image, path, level, strategy)
+    else:
+        image.save(path, compress_level=level, compress_type=strategy)
@@ -0,0 +1,109 @@
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Per-stage wall time, CPU time and peak memory. Peak memory is the rise of the
+# process RSS high-water mark over the stage, which Linux lets us restart per
+# stage; elsewhere it falls back to tracemalloc (when tracing) or is left out.
+
+
+def read_status(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss():
+    # VmHWM where there is one: ru_maxrss survives exec, so a spawned worker would
+    # start with its parent's peak
+    peak = read_status("VmHWM:")
+    if peak is not None or resource is None:
+        return peak
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_peak_rss():
+    # Restarts the high-water mark at the current RSS; False where that is not possible
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+class BakeMetrics:
+    # Stages are accumulated by name (a streamed bake runs "bake" once per strip)
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        if reset_peak_rss():
+            before, source = read_status("VmRSS:"), "rss"
+        elif tracemalloc.is_tracing() and hasattr(tracemalloc, "reset_peak"):
+            # reset_peak is 3.9+; without it the peak would span the whole run
+            tracemalloc.reset_peak()
+            before, source = tracemalloc.get_traced_memory()[0], "tracemalloc"
+        else:
+            before, source = None, None
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if source == "rss":
+                peak = peak_rss()
+            elif source == "tracemalloc":
+                peak = tracemalloc.get_traced_memory()[1]
+            peak = None if before is None or peak is None else max(0, peak - before)
+            self.add(name, wall, cpu, peak)
+
+    def add(self, name, wall, cpu, peak, calls=1):
+        record = self.stages.setdefault(name, {"stage": name, "wall_seconds": 0.0, "cpu_seconds": 0.0,
+                                               "peak_bytes": None, "calls": 0})
+        record["wall_seconds"] += wall
+        record["cpu_seconds"] += cpu
+        record["calls"] += calls
+        if peak is not None:
+            record["peak_bytes"] = max(peak, record["peak_bytes"] or 0)
+
+    def merge(self, records):
+        for record in records:
+            self.add(record["stage"], record["wall_seconds"], record["cpu_seconds"], record["peak_bytes"], record["calls"])
+
+    def records(self):
+        return list(self.stages.values())
+
+
+def stage(metrics, name):
+    # Lets callers take metrics=None without a branch around every stage
+    return metrics.stage(name) if metrics is not None else nullcontext()
+
+
+def format_stages(records):
+    parts = []
+    for record in records:
+        text = f"{record['stage']} {record['wall_seconds']:.2f}s"
+        if record["peak_bytes"]:
+            text += f" (+{record['peak_bytes'] / 2**20:.0f} MiB)"
+        parts.append(text)
+    return " · ".join(parts)
+
+
+def format_cache(stats):
+    lookups = stats["hits"] + stats["misses"]
+    return f"textures {stats['hits']}/{lookups} cached ({stats['bytes'] / 2**20:.0f} MiB)"
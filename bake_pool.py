@@ -0,0 +1,320 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+
+from PIL import Image
+
+from bake_batch import (ROLES, bake_factions, check_texture_set, load_badge, load_texture_set, output_paths, resolve_mode,
+                        write_outputs)
+from bake_dds import set_encode_threads
+from bake_engine import place_badge, set_kernel_threads
+from bake_io import load_texture, texture_cache
+from bake_metrics import BakeMetrics, stage
+
+# Jobs are a ship plus a group of factions: the ship is decoded and prepared once
+# per job and every faction in the group is a cheap color pass. When there are
+# fewer ships than workers a ship's factions are split over several jobs; the
+# ship is then decoded once, by a worker, into shared memory blocks that those
+# jobs map without copying.
+#
+# Job functions return (result, stage records); the records are None unless the
+# caller asked for metrics.
+
+
+def default_workers():
+    return os.cpu_count() or 1
+
+
+def share_cores(workers):
+    # Pool initializer: a JIT kernel or DDS encoder in each worker gets its share of the cores
+    set_kernel_threads((os.cpu_count() or 1) // workers)
+    set_encode_threads((os.cpu_count() or 1) // workers)
+
+
+def bake_group(images, texture_set, factions, mode, out_dir, ext, glow=None, metrics=None):
+    # A worker bakes many jobs that share one badge
+    badge = load_badge(texture_set, metrics, texture_cache)
+    written = []
+    for faction, output, glow_output in bake_factions(images, factions, mode, glow, metrics):
+        if badge is not None:
+            with stage(metrics, "badge"):
+                place_badge(output, badge, texture_set["badge"])
+        written.append(write_outputs(output, glow_output, output_paths(out_dir, texture_set, faction, ext), metrics))
+    return written
+
+
+def job_metrics(measure):
+    return BakeMetrics() if measure else None
+
+
+def job_result(result, metrics):
+    return result, metrics.records() if metrics is not None else None
+
+
+def bake_ship(texture_set, factions, mode, out_dir, ext, glow=None, measure=False, textures=None):
+    metrics = job_metrics(measure)
+    images = load_texture_set(texture_set, metrics, textures)
+    return job_result(bake_group(images, texture_set, factions, mode, out_dir, ext, glow, metrics), metrics)
+
+
+def bake_tiled_job(texture_set, color1, color2, mode, paths, tile_rows, glow=None, measure=False):
+    # Imported here: streaming needs NumPy, plain bakes don't
+    from bake_tiles import bake_tiled
+    metrics = job_metrics(measure)
+    return job_result(bake_tiled(texture_set, color1, color2, mode, paths, tile_rows, glow, metrics), metrics)
+
+
+def faction_groups(factions, count):
+    # No factions gives no groups rather than a zero step
+    size = max(1, -(-len(factions) // max(1, count)))
+    return [factions[i:i + size] for i in range(0, len(factions), size)]
+
+
+def report_group(report, texture_set, factions, written, error):
+    for i, (faction, colors) in enumerate(factions):
+        report(texture_set, faction, None if error else written[i], error)
+    return len(factions) if error else 0
+
+
+def record_job(metrics, texture_set, factions, records):
+    if metrics is not None and records is not None:
+        metrics.append({"ship": texture_set["name"], "factions": [faction for faction, colors in factions],
+                        "stages": records})
+
+
+def finish_job(report, metrics, texture_set, factions, result, error):
+    # result is a job's (written, records)
+    written, records = (None, None) if error else result
+    record_job(metrics, texture_set, factions, records)
+    return report_group(report, texture_set, factions, written, error)
+
+
+def allocate_block(path):
+    with Image.open(path) as image:
+        size = image.size
+    return shared_memory.SharedMemory(create=True, size=size[0] * size[1] * 4), size
+
+
+def allocate_blocks(texture_set):
+    # Sized from the file headers so the parent owns (and later unlinks) every block
+    check_texture_set(texture_set)
+    blocks = {}
+    try:
+        for role in ROLES:
+            if role in texture_set:
+                blocks[role] = allocate_block(texture_set[role])
+    except BaseException:
+        release_blocks(blocks)
+        raise
+    return blocks
+
+
+def release_blocks(blocks):
+    for shm, size in blocks.values():
+        shm.close()
+        shm.unlink()
+
+
+def block_names(blocks):
+    return {role: (shm.name, size) for role, (shm, size) in blocks.items()}
+
+
+def attach(names):
+    return {role: (shared_memory.SharedMemory(name=name), size) for role, (name, size) in names.items()}
+
+
+def decode_into_blocks(texture_set, names, measure=False, textures=None):
+    metrics = job_metrics(measure)
+    attached = attach(names)
+    try:
+        with stage(metrics, "load"):
+            for role, (shm, size) in attached.items():
+                image = load_texture(texture_set[role], textures)
+                if image.size != size:
+                    raise ValueError(f"{role.upper()} size changed while decoding")
+                shm.buf[:size[0] * size[1] * 4] = image.tobytes()
+        return job_result(None, metrics)
+    finally:
+        for shm, size in attached.values():
+            shm.close()
+
+
+def bake_shared(texture_set, names, factions, mode, out_dir, ext, glow=None, measure=False):
+    metrics = job_metrics(measure)
+    attached = attach(names)
+    try:
+        images = {role: Image.frombuffer("RGBA", size, shm.buf, "raw", "RGBA", 0, 1)
+                  for role, (shm, size) in attached.items()}
+        written = bake_group(images, texture_set, factions, mode, out_dir, ext, glow, metrics)
+        # The images map the shared buffers and must go before close()
+        del images
+        return job_result(written, metrics)
+    finally:
+        for shm, size in attached.values():
+            shm.close()
+
+
+def bake_inline(sets, factions, out_dir, mode, ext, glow, report, metrics, textures):
+    failures = 0
+    measure = metrics is not None
+    for texture_set in sets:
+        try:
+            result = bake_ship(texture_set, factions, resolve_mode(texture_set, mode), out_dir, ext, glow, measure, textures)
+            error = None
+        except Exception as e:
+            result, error = None, e
+        failures += finish_job(report, metrics, texture_set, factions, result, error)
+    return failures
+
+
+def bake_per_ship(pool, sets, factions, out_dir, mode, ext, glow, report, metrics, textures):
+    failures = 0
+    measure = metrics is not None
+    futures = [(pool.submit(bake_ship, s, factions, resolve_mode(s, mode), out_dir, ext, glow, measure, textures), s)
+               for s in sets]
+    for future, texture_set in futures:
+        error = future.exception()
+        failures += finish_job(report, metrics, texture_set, factions, None if error else future.result(), error)
+    return failures
+
+
+def bake_fanned_out(pool, workers, sets, groups, out_dir, mode, ext, glow, report, metrics, textures):
+    failures = 0
+    everyone = [faction for group in groups for faction in group]
+    measure = metrics is not None
+    # Enough decoded ships in flight to keep every worker busy, and no more
+    window = max(2, -(-workers // len(groups)) + 1)
+    pending_sets = iter(sets)
+    live = {}
+    ships = 0
+    exhausted = False
+    while live or not exhausted:
+        while not exhausted and ships < window:
+            texture_set = next(pending_sets, None)
+            if texture_set is None:
+                exhausted = True
+                break
+            try:
+                blocks = allocate_blocks(texture_set)
+            except Exception as e:
+                failures += report_group(report, texture_set, everyone, None, e)
+                continue
+            ship = {"set": texture_set, "blocks": blocks, "names": block_names(blocks), "pending": 0}
+            live[pool.submit(decode_into_blocks, texture_set, ship["names"], measure, textures)] = (ship, None)
+            ships += 1
+        if not live:
+            continue
+        done, _ = wait(live, return_when=FIRST_COMPLETED)
+        for future in done:
+            ship, group = live.pop(future)
+            texture_set = ship["set"]
+            error = future.exception()
+            if group is not None:
+                ship["pending"] -= 1
+                failures += finish_job(report, metrics, texture_set, group, None if error else future.result(), error)
+            elif error is not None:
+                failures += report_group(report, texture_set, everyone, None, error)
+            else:
+                record_job(metrics, texture_set, [], future.result()[1])
+                ship_mode = resolve_mode(texture_set, mode)
+                for group in groups:
+                    job = pool.submit(bake_shared, texture_set, ship["names"], group, ship_mode, out_dir, ext, glow, measure)
+                    live[job] = (ship, group)
+                ship["pending"] = len(groups)
+            if ship["pending"] == 0:
+                release_blocks(ship["blocks"])
+                ships -= 1
+    return failures
+
+
+def bake_streamed(pool, sets, factions, out_dir, mode, ext, glow, tile_rows, report, metrics):
+    # Streaming jobs read their own strips, so there is nothing to share between them
+    failures = 0
+    jobs = []
+    for texture_set in sets:
+        for faction in factions:
+            name, colors = faction
+            args = (texture_set, colors[0], colors[1], resolve_mode(texture_set, mode),
+                    output_paths(out_dir, texture_set, name, ext), tile_rows, glow, metrics is not None)
+            jobs.append((texture_set, faction, pool.submit(bake_tiled_job, *args) if pool else args))
+    for texture_set, faction, job in jobs:
+        try:
+            result, error = job.result() if pool else bake_tiled_job(*job), None
+        except Exception as e:
+            result, error = None, e
+        failures += finish_job(report, metrics, texture_set, [faction], None if error else ([result[0]], result[1]), error)
+    return failures
+
+
+def serve_cached(cache, sets, factions, out_dir, mode, ext, glow, tile_rows, report):
+    # Copies cached outputs into place and reports them. Returns the plan of what
+    # is left to bake and the cache key of every miss
+    keys = {}
+    missing = []
+    for texture_set in sets:
+        ship_mode = resolve_mode(texture_set, mode)
+        todo = []
+        for faction in factions:
+            name, colors = faction
+            try:
+                key = cache.key(texture_set, colors, ship_mode, ext, glow, tile_rows)
+            except OSError:
+                # Unreadable inputs are left for the bake to report
+                todo.append(faction)
+                continue
+            written = cache.fetch(key, output_paths(out_dir, texture_set, name, ext))
+            if written is None:
+                keys[texture_set["name"], name] = key
+                todo.append(faction)
+            else:
+                report(texture_set, name, written, None)
+        if todo:
+            missing.append((texture_set, todo))
+    return missing, keys
+
+
+def bake_all(sets, factions, out_dir, mode=None, workers=None, ext=".png", report=None, tile_rows=None, glow=None,
+             metrics=None, cache=None, textures=None):
+    # factions: [(name, (color1, color2))]; report(texture_set, faction, written, error) per job.
+    # metrics: a list that receives {"ship", "factions", "stages"} for every job.
+    # cache: a BakeCache; hits are copied from it and only the misses are baked.
+    # textures: what inputs are loaded through (a TextureCache or RawTextureStore); None decodes them
+    if not factions:
+        return 0
+    workers = workers or default_workers()
+    report = report or (lambda *args: None)
+    if cache is not None:
+        missing, keys = serve_cached(cache, sets, factions, out_dir, mode, ext, glow, tile_rows, report)
+
+        def store(texture_set, faction, written, error):
+            key = keys.get((texture_set["name"], faction))
+            if error is None and key is not None:
+                cache.store(key, written)
+            report(texture_set, faction, written, error)
+
+        return bake_plan(missing, out_dir, mode, workers, ext, store, tile_rows, glow, metrics, None, textures)
+    if tile_rows:
+        if workers == 1:
+            return bake_streamed(None, sets, factions, out_dir, mode, ext, glow, tile_rows, report, metrics)
+        with ProcessPoolExecutor(workers, initializer=share_cores, initargs=(workers,)) as pool:
+            return bake_streamed(pool, sets, factions, out_dir, mode, ext, glow, tile_rows, report, metrics)
+    if workers == 1:
+        return bake_inline(sets, factions, out_dir, mode, ext, glow, report, metrics, textures)
+    sets = list(sets)
+    # Split factions only as far as needed to give every worker something to do
+    groups = faction_groups(factions, min(len(factions), max(1, -(-workers // max(1, len(sets))))))
+    with ProcessPoolExecutor(workers, initializer=share_cores, initargs=(workers,)) as pool:
+        if len(groups) == 1:
+            return bake_per_ship(pool, sets, factions, out_dir, mode, ext, glow, report, metrics, textures)
+        return bake_fanned_out(pool, workers, sets, groups, out_dir, mode, ext, glow, report, metrics, textures)
+
+
+def bake_plan(plan, out_dir, mode=None, workers=None, ext=".png", report=None, tile_rows=None, glow=None, metrics=None,
+              cache=None, textures=None):
+    # plan: [(texture_set, factions)] for ships that need different factions;
+    # ships that need the same ones are baked together by one bake_all
+    groups = {}
+    for texture_set, factions in plan:
+        groups.setdefault(tuple(name for name, colors in factions), (factions, []))[1].append(texture_set)
+    return sum(bake_all(sets, factions, out_dir, mode, workers, ext, report, tile_rows, glow, metrics, cache, textures)
+               for factions, sets in groups.values())
@@ -0,0 +1,59 @@
+import json
+import os
+
+DEFAULT_PRESETS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "faction_color_presets_named.json")
+
+
+def normalize_hex(h):
+    if not isinstance(h, str):
+        return '#000000'
+    h = h.strip()
+    if not h:
+        return '#000000'
+    if not h.startswith('#'):
+        h = '#' + h
+    if len(h) == 4:
+        r = h[1]*2; g = h[2]*2; b = h[3]*2
+        h = f'#{r}{g}{b}'
+    return h.lower()
+
+
+def hex_to_rgb_tuple(hex_color):
+    h = hex_color.lstrip('#')
+    if len(h) != 6:
+        raise ValueError("Invalid hex color")
+    return (int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16))
+
+
+def parse_presets(data):
+    # Accepts {"name": {"primary": ..., "secondary": ...}} or [{"faction": ..., "primary": ..., ...}]
+    loaded = {}
+    if isinstance(data, dict):
+        for k, v in data.items():
+            if isinstance(v, dict):
+                ph = normalize_hex(v.get("primary") or v.get("primary_hex") or v.get("p") or "")
+                sh = normalize_hex(v.get("secondary") or v.get("secondary_hex") or v.get("s") or "")
+                if ph and sh:
+                    loaded[k] = (ph, sh)
+    elif isinstance(data, list):
+        for item in data:
+            if not isinstance(item, dict):
+                continue
+            name = item.get("faction") or item.get("name") or item.get("key")
+            ph = normalize_hex(item.get("primary") or item.get("primary_hex") or "")
+            sh = normalize_hex(item.get("secondary") or item.get("secondary_hex") or "")
+            if name and ph and sh:
+                loaded[name] = (ph, sh)
+    return loaded
+
+
+def load_presets(path=DEFAULT_PRESETS_FILE):
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_presets(json.load(f))
+
+
+def preset_colors(presets, name):
+    if name not in presets:
+        raise ValueError(f"Preset not found: {name}")
+    ph, sh = presets[name]
+    return hex_to_rgb_tuple(ph), hex_to_rgb_tuple(sh)
@@ -0,0 +1,112 @@
+from functools import lru_cache
+
+from PIL import Image, ImageChops
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Canvas previews are a few hundred pixels wide; a halving pyramid built once per
+# image lets every refresh resample from the nearest level instead of the source.
+
+MIN_LEVEL = 64
+REDUCE_MODES = ("L", "LA", "RGB", "RGBA", "I", "F")
+
+
+class PreviewPyramid:
+    def __init__(self, image):
+        if image.mode not in REDUCE_MODES:
+            image = image.convert("RGBA")
+        self.size = image.size
+        self.levels = [image]
+        while min(self.levels[-1].size) >= 2 * MIN_LEVEL:
+            self.levels.append(self.levels[-1].reduce(2))
+        self.last = None
+
+    def level_for(self, size):
+        # Smallest level still at least as large as the request
+        for level in reversed(self.levels):
+            if level.width >= size[0] and level.height >= size[1]:
+                return level
+        return self.levels[0]
+
+    def thumbnail(self, size):
+        if self.last is not None and self.last.size == size:
+            return self.last
+        level = self.level_for(size)
+        self.last = level if level.size == size else level.resize(size, Image.Resampling.LANCZOS)
+        return self.last
+
+
+class PreviewCache:
+    # One pyramid per preview slot; a different image object, or invalidate(), rebuilds it
+    def __init__(self):
+        self.entries = {}
+
+    def thumbnail(self, name, image, size):
+        entry = self.entries.get(name)
+        if entry is None or entry[0] is not image:
+            entry = (image, PreviewPyramid(image))
+            self.entries[name] = entry
+        return entry[1].thumbnail(size)
+
+    def invalidate(self, name=None):
+        if name is None:
+            self.entries.clear()
+        else:
+            self.entries.pop(name, None)
+
+
+def hsv_to_rgb_array(h, s, v):
+    # colorsys.hsv_to_rgb over arrays, same float steps so int(c * 255) matches
+    h, s, v = np.broadcast_arrays(*(np.asarray(x, np.float64) for x in (h, s, v)))
+    i = (h * 6.0).astype(np.int64)
+    f = h * 6.0 - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    sectors = [i == k for k in range(6)]
+    r = np.select(sectors, [v, q, p, p, t, v])
+    g = np.select(sectors, [t, v, v, q, p, p])
+    b = np.select(sectors, [p, p, t, v, v, q])
+    grey = s == 0.0
+    return [np.where(grey, v, c) for c in (r, g, b)]
+
+
+def rgb_image(r, g, b):
+    return Image.fromarray(np.dstack([(c * 255).astype(np.uint8) for c in (r, g, b)]), "RGB")
+
+
+def ramp(width, height, vertical=False):
+    # 0 to 255 left to right (or top to bottom) as an "L" image
+    length = height if vertical else width
+    steps = bytes(int(i * 255 / max(1, length - 1)) for i in range(length))
+    line = Image.frombytes("L", (1, height) if vertical else (width, 1), steps)
+    return line.resize((width, height), Image.Resampling.NEAREST)
+
+
+def hsv_image(h, s, v):
+    # Without NumPy: Pillow's own HSV conversion, within a level of the colorsys path
+    return Image.merge("HSV", (h, s, v)).convert("RGB")
+
+
+@lru_cache(maxsize=64)
+def sv_square(hue, size=256):
+    # Saturation left to right, value top to bottom, for one hue
+    if np is None:
+        return hsv_image(Image.new("L", (size, size), int(hue * 255)), ramp(size, size),
+                         ImageChops.invert(ramp(size, size, vertical=True)))
+    s = np.arange(size)[None, :] / (size - 1)
+    v = 1.0 - np.arange(size)[:, None] / (size - 1)
+    return rgb_image(*hsv_to_rgb_array(hue, s, v))
+
+
+@lru_cache(maxsize=4)
+def hue_strip(width=256, height=20):
+    if np is None:
+        full = Image.new("L", (width, height), 255)
+        return hsv_image(ramp(width, height), full, full)
+    h = np.arange(width)[None, :].repeat(height, 0) / (width - 1)
+    return rgb_image(*hsv_to_rgb_array(h, 1.0, 1.0))
@@ -0,0 +1,120 @@
+import os
+
+from bake_batch import load_manifest, output_paths, parse_mode, resolve_mode
+from bake_cache import FileHashes, bake_key, read_json, write_json
+from bake_pool import bake_plan
+from bake_presets import DEFAULT_PRESETS_FILE, load_presets, preset_colors
+
+# Make-style builds of a whole mod. A project is a bake manifest with the build
+# settings next to the ship list; a state file beside it remembers the key of
+# every output it produced, so a build only bakes outputs whose inputs, colors or
+# settings changed, or whose files went missing or were edited since.
+
+DEFAULT_PROJECT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bake_project.json")
+
+
+def state_path(project_path):
+    return os.path.splitext(project_path)[0] + ".state.json"
+
+
+def load_project(path):
+    data = read_json(path, None)
+    if not isinstance(data, dict):
+        raise ValueError(f"Not a bake project: {path}")
+    base_dir = os.path.dirname(os.path.abspath(path))
+    presets = load_presets(os.path.join(base_dir, data["presets"]) if data.get("presets") else DEFAULT_PRESETS_FILE)
+    glow = data.get("glow") or {}
+    project = {
+        "out": os.path.join(base_dir, data.get("out", "baked")),
+        "ext": data.get("ext", ".png"),
+        "mode": parse_mode(data.get("mode")),
+        "glow": {"softness": int(glow.get("softness", 0)), "feather": float(glow.get("feather", 0.0))},
+        "plan": [],
+    }
+    default_factions = data.get("factions", "all")
+    for texture_set in load_manifest(path):
+        names = texture_set.pop("factions", None) or default_factions
+        if names == "all":
+            names = list(presets)
+        project["plan"].append((texture_set, [(name, preset_colors(presets, name)) for name in names]))
+    return project
+
+
+def file_state(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class BuildState:
+    def __init__(self, path):
+        self.path = path
+        data = read_json(path, {})
+        self.hashes = FileHashes(data.get("hashes"))
+        self.targets = data.get("targets", {})
+
+    def is_current(self, target, key):
+        record = self.targets.get(target)
+        if not record or record["key"] != key:
+            return False
+        try:
+            return all(file_state(path) == state for path, state in record["files"])
+        except OSError:
+            return False
+
+    def record(self, target, key, written):
+        self.targets[target] = {"key": key, "files": [[path, file_state(path)] for path in written]}
+
+    def save(self):
+        write_json({"hashes": self.hashes.prune(), "targets": self.targets}, self.path)
+
+
+def stale_plan(project, state, force=False):
+    # Returns (plan of outputs to rebake, their keys, count of up-to-date outputs)
+    stale = []
+    keys = {}
+    current = 0
+    for texture_set, factions in project["plan"]:
+        mode = resolve_mode(texture_set, project["mode"])
+        todo = []
+        for faction in factions:
+            name, colors = faction
+            target = output_paths(project["out"], texture_set, name, project["ext"])[0]
+            try:
+                key = bake_key(state.hashes, texture_set, colors, mode, project["ext"], project["glow"])
+            except OSError:
+                # Unreadable inputs are left for the bake to report
+                todo.append(faction)
+                continue
+            if not force and state.is_current(target, key):
+                current += 1
+                continue
+            keys[target] = key
+            todo.append(faction)
+        if todo:
+            stale.append((texture_set, todo))
+    return stale, keys, current
+
+
+def build_project(path, workers=None, report=None, force=False, dry_run=False, cache=None, metrics=None,
+                  textures=None):
+    # Returns (outputs baked or to bake, outputs up to date, failures)
+    project = load_project(path)
+    state = BuildState(state_path(path))
+    stale, keys, current = stale_plan(project, state, force)
+    if dry_run:
+        return stale, current, 0
+    report = report or (lambda *args: None)
+
+    def record(texture_set, faction, written, error):
+        target = output_paths(project["out"], texture_set, faction, project["ext"])[0]
+        if error is None and target in keys:
+            state.record(target, keys[target], written)
+        report(texture_set, faction, written, error)
+
+    try:
+        failures = bake_plan(stale, project["out"], project["mode"], workers, project["ext"], record, None,
+                             project["glow"], metrics, cache, textures)
+    finally:
+        # Whatever finished is remembered, even if the build was interrupted
+        state.save()
+    return stale, current, failures
@@ -0,0 +1,130 @@
+import hashlib
+import mmap
+import os
+import struct
+
+from PIL import Image
+
+from bake_cache import file_digest
+from bake_io import decode_texture, ensure_parent
+
+# Decoded textures stored as uncompressed RGBA behind a small header, opened
+# with mmap. An image read this way is a read-only view of the page cache, so
+# every process loading the same sources shares one copy of the file pixels and
+# none of them decodes (the bake still copies out the channel planes it works
+# on). Files are named after the source's path plus its size and mtime: an
+# edited source is converted again on its next load and its older file is
+# removed. Past max_bytes, the least recently loaded files are evicted.
+
+RAW_EXTENSION = ".hwraw"
+MAGIC = b"HWRAW\0\0\0"
+VERSION = 1
+# magic, version, width, height, channels, sha256 of the source file
+HEADER = struct.Struct("<8sIIII32s")
+HEADER_SIZE = 64
+DEFAULT_RAW_CACHE_SIZE = 8 << 30
+
+
+def write_raw(image, path, source_digest):
+    image = image if image.mode == "RGBA" else image.convert("RGBA")
+    header = HEADER.pack(MAGIC, VERSION, image.width, image.height, 4, bytes.fromhex(source_digest))
+    ensure_parent(path)
+    # Written aside and renamed so concurrent readers never map half a file
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(header.ljust(HEADER_SIZE, b"\0"))
+        f.write(image.tobytes())
+    os.replace(temp, path)
+
+
+def read_header(mapped):
+    magic, version, width, height, channels, digest = HEADER.unpack_from(mapped)
+    if magic != MAGIC or version != VERSION or channels != 4:
+        raise ValueError("not a raw texture")
+    if len(mapped) != HEADER_SIZE + width * height * channels:
+        raise ValueError("truncated raw texture")
+    return (width, height), digest.hex()
+
+
+def open_raw(path):
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        size, digest = read_header(mapped)
+    except (ValueError, struct.error):
+        mapped.close()
+        raise ValueError(f"{path}: not a raw texture") from None
+    # The image keeps the mapping alive; writes to it would fail, so callers copy first
+    return Image.frombuffer("RGBA", size, memoryview(mapped)[HEADER_SIZE:], "raw", "RGBA", 0, 1)
+
+
+class RawTextureStore:
+    # Same load(path) interface as TextureCache, so it can stand in for it
+    def __init__(self, root, max_bytes=DEFAULT_RAW_CACHE_SIZE):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.converted = 0
+        self.mapped = 0
+
+    def raw_path(self, path):
+        # <root>/<shard>/<path hash>.<state hash>.hwraw: all versions of a source share a prefix
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        source = hashlib.sha256(path.encode("utf-8")).hexdigest()
+        state = hashlib.sha256(f"{stat.st_size}\0{stat.st_mtime_ns}".encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.root, source[:2], f"{source}.{state}{RAW_EXTENSION}")
+
+    def load(self, path):
+        target = self.raw_path(path)
+        try:
+            image = open_raw(target)
+            self.mapped += 1
+            # The file mtime is the LRU timestamp for evict()
+            os.utime(target)
+            return image
+        except (OSError, ValueError):
+            pass
+        write_raw(decode_texture(path), target, file_digest(path))
+        self.converted += 1
+        self.remove_stale(target)
+        return open_raw(target)
+
+    def remove_stale(self, target):
+        # Earlier conversions of the same source, left behind by edits
+        folder, name = os.path.split(target)
+        prefix = name.split(".")[0] + "."
+        for entry in os.scandir(folder):
+            if entry.name.startswith(prefix) and entry.name.endswith(RAW_EXTENSION) and entry.path != target:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    # Still mapped by another process on Windows; evict() gets it later
+                    pass
+
+    def entries(self):
+        found = []
+        if not os.path.isdir(self.root):
+            return found
+        for shard in os.scandir(self.root):
+            if shard.is_dir():
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(RAW_EXTENSION):
+                        stat = entry.stat()
+                        found.append((stat.st_mtime, stat.st_size, entry.path))
+        return found
+
+    def evict(self):
+        # Least recently loaded files go first until the store fits its cap
+        found = sorted(self.entries())
+        total = sum(size for used, size, path in found)
+        removed = 0
+        for used, size, path in found:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,204 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from bake_batch import ROLES, bake_images, check_texture_set, parse_mode, resolve_mode
+from bake_io import decode_texture, resample_cache, texture_cache
+from bake_pool import default_workers, share_cores
+from bake_presets import hex_to_rgb_tuple, load_presets, normalize_hex, preset_colors
+
+# Local bake server. POST /bake takes JSON naming each texture by path or by
+# base64 bytes, plus a preset or two colors, and answers with the baked PNG (and
+# glow PNG) as base64. Bakes run on a process pool that lives as long as the
+# server; each worker keeps recently decoded textures, so repeat requests for the
+# same ship skip the decode. Requests beyond the queue limit are turned away
+# with 503 and Retry-After instead of piling up.
+
+DEFAULT_PORT = 8765
+MAX_BODY = 512 << 20
+WORKER_CACHE_BYTES = 1 << 30
+RETRY_AFTER = 1
+
+
+def configure_worker(cache_bytes, workers):
+    texture_cache.resize(cache_bytes)
+    resample_cache.resize(cache_bytes)
+    share_cores(workers)
+
+
+def decode_input(source):
+    # source: ("path", path) or ("bytes", data); uploads are keyed by their hash
+    kind, value = source
+    if kind == "path":
+        return texture_cache.load(value)
+    return texture_cache.get(("bytes", hashlib.sha256(value).hexdigest()), lambda: decode_texture(io.BytesIO(value)))
+
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def bake_request(sources, color1, color2, mode, glow=None):
+    # Runs in a worker; returns (result PNG, glow PNG or None, (worker pid, texture cache stats))
+    images = {role: decode_input(source) for role, source in sources.items()}
+    output, glow_output = bake_images(images, color1, color2, mode, glow, resample_cache=resample_cache)
+    return (encode_png(output), encode_png(glow_output) if glow_output is not None else None,
+            (os.getpid(), texture_cache.stats()))
+
+
+def parse_source(role, value):
+    if isinstance(value, str):
+        return "path", value
+    if isinstance(value, dict) and "data" in value:
+        try:
+            return "bytes", base64.b64decode(value["data"], validate=True)
+        except ValueError:
+            raise ValueError(f"{role}: invalid base64 data") from None
+    raise ValueError(f"{role}: expected a path or {{\"data\": <base64>}}")
+
+
+def parse_request(request, presets):
+    # Returns the bake_request arguments for a /bake body
+    if not isinstance(request, dict):
+        raise ValueError("Expected a JSON object")
+    sources = {role: parse_source(role, request[role]) for role in ROLES if request.get(role)}
+    check_texture_set(sources)
+    if request.get("colors"):
+        color1, color2 = (hex_to_rgb_tuple(normalize_hex(c)) for c in request["colors"])
+    elif request.get("preset"):
+        color1, color2 = preset_colors(presets, request["preset"])
+    else:
+        raise ValueError("Give a preset or two colors")
+    mode = resolve_mode(sources, parse_mode(request.get("mode")))
+    glow = request.get("glow_options") or {}
+    glow = {"softness": int(glow.get("softness", 0)), "feather": float(glow.get("feather", 0.0))}
+    return sources, color1, color2, mode, glow
+
+
+class BakeService:
+    def __init__(self, presets_path, workers=None, queue=None, cache_bytes=WORKER_CACHE_BYTES):
+        self.presets = load_presets(presets_path)
+        self.workers = workers or default_workers()
+        # Running plus waiting bakes; past this, requests get 503
+        self.queue = queue or 2 * self.workers
+        self.slots = threading.BoundedSemaphore(self.queue)
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.served = 0
+        self.rejected = 0
+        # Latest texture cache stats of each worker, by pid
+        self.caches = {}
+        self.cache_bytes = cache_bytes
+        self.pool = self.start_pool()
+
+    def start_pool(self):
+        return ProcessPoolExecutor(self.workers, initializer=configure_worker,
+                                   initargs=(self.cache_bytes, self.workers))
+
+    def status(self):
+        with self.lock:
+            caches = list(self.caches.values())
+            return {"workers": self.workers, "queue": self.queue, "pending": self.pending,
+                    "served": self.served, "rejected": self.rejected,
+                    "texture_cache": {field: sum(stats[field] for stats in caches)
+                                      for field in ("hits", "misses", "evictions", "entries", "bytes")}}
+
+    def reserve(self):
+        # Takes a queue slot before the request body is read, so a full queue
+        # turns uploads away without holding them in memory; False when full
+        if not self.slots.acquire(blocking=False):
+            with self.lock:
+                self.rejected += 1
+            return False
+        with self.lock:
+            self.pending += 1
+        return True
+
+    def release(self):
+        with self.lock:
+            self.pending -= 1
+        self.slots.release()
+
+    def bake(self, request):
+        # Returns the response body; the caller holds a slot from reserve()
+        args = parse_request(request, self.presets)
+        pool = self.pool
+        try:
+            result, glow, (pid, stats) = pool.submit(bake_request, *args).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory): replace the pool so later
+            # requests don't all fail with it
+            with self.lock:
+                if self.pool is pool:
+                    self.pool = self.start_pool()
+            pool.shutdown(wait=False)
+            raise RuntimeError("Bake worker crashed; the worker pool was restarted") from None
+        with self.lock:
+            self.caches[pid] = stats
+            self.served += 1
+        return {"mode": args[3], "result": base64.b64encode(result).decode("ascii"),
+                "glow": base64.b64encode(glow).decode("ascii") if glow is not None else None}
+
+    def close(self):
+        self.pool.shutdown()
+
+
+class BakeHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def send_json(self, status, data, headers=()):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/status":
+            self.send_json(200, self.service.status())
+        else:
+            self.send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self.path != "/bake":
+            self.send_json(404, {"error": "not found"})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.send_json(413, {"error": f"request larger than {MAX_BODY >> 20} MiB"})
+            return
+        if not self.service.reserve():
+            # The unread body is discarded with the connection
+            self.close_connection = True
+            self.send_json(503, {"error": "bake queue full"}, [("Retry-After", str(RETRY_AFTER))])
+            return
+        try:
+            response = self.service.bake(json.loads(self.rfile.read(length) or b"null"))
+        except (OSError, ValueError, KeyError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+        except Exception as e:
+            self.send_json(500, {"error": str(e)})
+            return
+        finally:
+            self.service.release()
+        self.send_json(200, response)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(service, host="127.0.0.1", port=DEFAULT_PORT):
+    handler = type("ServiceHandler", (BakeHandler,), {"service": service})
+    return ThreadingHTTPServer((host, port), handler)
@@ -0,0 +1,275 @@
+import io
+import math
+import struct
+import zlib
+
+import numpy as np
+from PIL import Image
+
+from bake_batch import check_texture_set
+from bake_engine import HWRM, PreparedBake, as_rgba, bake_glow, bake_team_color, glow_mask
+from bake_io import ensure_parent
+from bake_metrics import stage
+from bake_png import PNG_SIGNATURE, png_chunk, png_header, sub_filter
+
+# Streaming bake for atlases too big to hold several full RGBA copies of.
+# Inputs are read in row strips, baked and appended to the output PNGs, so peak
+# memory follows the strip size. Non-interlaced 8-bit PNG and single raw-tile
+# formats (uncompressed TGA/BMP/TIFF) stream; other inputs are decoded whole.
+
+TILE_ROWS = 256
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+# Half-width of each filter's kernel at scale 1, used to size the resample margins
+FILTER_SUPPORT = {Image.Resampling.NEAREST: 1, Image.Resampling.BOX: 0.5, Image.Resampling.BILINEAR: 1,
+                  Image.Resampling.HAMMING: 1, Image.Resampling.BICUBIC: 2, Image.Resampling.LANCZOS: 3}
+
+
+class PngStripReader:
+    # Inflates IDAT incrementally; each strip is re-wrapped as a tiny stored PNG
+    # (previous raw row + the strip's filtered rows) so Pillow does the unfiltering.
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        try:
+            if self.file.read(8) != PNG_SIGNATURE:
+                raise ValueError("not a PNG")
+            self.extra = b""
+            while True:
+                length, kind = struct.unpack(">I4s", self.file.read(8))
+                if kind == b"IDAT":
+                    self.idat_left = length
+                    break
+                data = self.file.read(length)
+                self.file.read(4)
+                if kind == b"IHDR":
+                    width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", data)
+                elif kind in (b"PLTE", b"tRNS"):
+                    self.extra += png_chunk(kind, data)
+            if depth != 8 or interlace or color not in PNG_CHANNELS:
+                raise ValueError("PNG layout cannot be streamed")
+        except Exception:
+            self.file.close()
+            raise
+        self.size = (width, height)
+        self.depth_color = (depth, color)
+        self.row_bytes = width * PNG_CHANNELS[color] + 1
+        self.inflate = zlib.decompressobj()
+        self.pending = b""
+        self.prior = None
+
+    def compressed(self, limit=1 << 16):
+        while self.idat_left == 0:
+            self.file.read(4)
+            header = self.file.read(8)
+            if len(header) < 8:
+                return b""
+            length, kind = struct.unpack(">I4s", header)
+            if kind != b"IDAT":
+                return b""
+            self.idat_left = length
+        data = self.file.read(min(limit, self.idat_left))
+        self.idat_left -= len(data)
+        return data
+
+    def read(self, rows):
+        need = rows * self.row_bytes
+        while len(self.pending) < need:
+            data = self.inflate.unconsumed_tail or self.compressed()
+            if not data:
+                raise ValueError("truncated PNG data")
+            self.pending += self.inflate.decompress(data, need - len(self.pending))
+        filtered, self.pending = self.pending[:need], self.pending[need:]
+        width = self.size[0]
+        lead = 0 if self.prior is None else 1
+        raw = (b"\0" + self.prior if lead else b"") + filtered
+        header = struct.pack(">IIBBBBB", width, rows + lead, *self.depth_color, 0, 0, 0)
+        png = PNG_SIGNATURE + png_chunk(b"IHDR", header) + self.extra
+        png += png_chunk(b"IDAT", zlib.compress(raw, 0)) + png_chunk(b"IEND", b"")
+        with Image.open(io.BytesIO(png)) as image:
+            image.load()
+            strip = image.crop((0, lead, width, rows + lead)) if lead else image.copy()
+        self.prior = strip.crop((0, rows - 1, width, rows)).tobytes()
+        return as_rgba(strip)
+
+    def close(self):
+        self.file.close()
+
+
+class RawStripReader:
+    # Uncompressed single-tile layouts: rows are read straight from the file offset
+    def __init__(self, path):
+        image = Image.open(path)
+        try:
+            if len(image.tile) != 1 or image.tile[0][0] != "raw" or image.tile[0][1] != (0, 0) + image.size:
+                raise ValueError("not a raw single-tile image")
+            args = image.tile[0][3]
+            self.rawmode, stride, self.orientation = (args, 0, 1) if isinstance(args, str) else args
+            self.offset = image.tile[0][2]
+            self.mode = image.mode
+            self.info = dict(image.info)
+            self.size = image.size
+            if not stride:
+                stride = len(Image.new(self.mode, (self.size[0], 1)).tobytes("raw", self.rawmode))
+            self.stride = stride
+            self.file = image.fp
+            image.fp = None
+        except Exception:
+            image.close()
+            raise
+        self.top = 0
+
+    def read(self, rows):
+        height = self.size[1]
+        first = self.top if self.orientation > 0 else height - self.top - rows
+        self.file.seek(self.offset + first * self.stride)
+        data = self.file.read(rows * self.stride)
+        self.top += rows
+        strip = Image.frombuffer(self.mode, (self.size[0], rows), data, "raw", self.rawmode, self.stride, self.orientation)
+        strip.info.update(self.info)
+        return as_rgba(strip)
+
+    def close(self):
+        self.file.close()
+
+
+class FullStripReader:
+    def __init__(self, path):
+        with Image.open(path) as image:
+            self.image = image.convert("RGBA")
+        self.size = self.image.size
+        self.top = 0
+
+    def read(self, rows):
+        strip = self.image.crop((0, self.top, self.size[0], self.top + rows))
+        self.top += rows
+        return strip
+
+    def close(self):
+        self.image = None
+
+
+def open_strip_reader(path):
+    for reader in (PngStripReader, RawStripReader):
+        try:
+            return reader(path)
+        except (ValueError, OSError, struct.error):
+            pass
+    return FullStripReader(path)
+
+
+class StripSource:
+    # Forward-only row window over a reader, with look-back for resample margins
+    def __init__(self, reader):
+        self.reader = reader
+        self.size = reader.size
+        self.top = 0
+        self.rows = np.empty((0, self.size[0], 4), np.uint8)
+
+    def window(self, top, bottom):
+        bottom = min(bottom, self.size[1])
+        end = self.top + len(self.rows)
+        if top >= end:
+            if top > end:
+                self.reader.read(top - end)
+            self.rows = self.rows[:0]
+            self.top = end = top
+        elif top > self.top:
+            self.rows = self.rows[top - self.top:]
+            self.top = top
+        if bottom > end:
+            fresh = np.asarray(self.reader.read(bottom - end))
+            self.rows = np.concatenate([self.rows, fresh]) if len(self.rows) else fresh
+        return Image.fromarray(np.ascontiguousarray(self.rows[top - self.top:bottom - self.top]), "RGBA")
+
+    def strip(self, top, rows, size=None, resample=Image.Resampling.BICUBIC):
+        if size is None or size == self.size:
+            return self.window(top, top + rows)
+        # Source rows feeding output rows [top, top + rows), padded by the kernel reach
+        scale = self.size[1] / size[1]
+        reach = FILTER_SUPPORT.get(resample, 3) * max(scale, 1.0) + 2
+        src_top = max(0, int(math.floor(top * scale - reach)))
+        src_bottom = min(self.size[1], int(math.ceil((top + rows) * scale + reach)))
+        region = self.window(src_top, src_bottom)
+        box = (0, top * scale - src_top, self.size[0], (top + rows) * scale - src_top)
+        return region.resize((size[0], rows), resample, box=box)
+
+    def close(self):
+        self.reader.close()
+
+
+class PngStripWriter:
+    def __init__(self, path, size, compress_level=6):
+        self.size = size
+        self.rows = 0
+        ensure_parent(path)
+        self.file = open(path, "wb")
+        self.file.write(png_header(size))
+        self.deflate = zlib.compressobj(compress_level)
+
+    def write(self, strip):
+        data = self.deflate.compress(sub_filter(np.asarray(strip).reshape(strip.height, -1)).tobytes())
+        if data:
+            self.file.write(png_chunk(b"IDAT", data))
+        self.rows += strip.height
+
+    def close(self):
+        try:
+            if self.rows != self.size[1]:
+                raise ValueError(f"wrote {self.rows} of {self.size[1]} rows")
+            self.file.write(png_chunk(b"IDAT", self.deflate.flush()) + png_chunk(b"IEND", b""))
+        finally:
+            self.file.close()
+
+
+def glow_strip(source, top, rows, size, softness=0, feather=0):
+    # Feathering blurs across strip edges, so the mask is built on a padded strip and cropped
+    margin = math.ceil(3 * feather) + 3 if feather > 0 else 0
+    first = max(0, top - margin)
+    last = min(size[1], top + rows + margin)
+    glow = source.strip(first, last - first, size, Image.Resampling.LANCZOS)
+    lit = glow_mask(glow, glow.size, softness, feather)
+    return lit.crop((0, top - first, size[0], top - first + rows)) if margin else lit
+
+
+def bake_tiled(texture_set, color1, color2, mode, paths, tile_rows=TILE_ROWS, glow=None, metrics=None):
+    # Stage times add up over the strips; "load" covers reading and resampling them
+    check_texture_set(texture_set)
+    if texture_set.get("badge"):
+        raise ValueError("badges are not supported by streaming bakes")
+    sources = {}
+    writers = []
+    try:
+        for role in ("bc", "team", "mask", "glow"):
+            if role in texture_set and (role != "glow" or mode == HWRM):
+                sources[role] = StripSource(open_strip_reader(texture_set[role]))
+        size = sources["bc"].size
+        writers.append(PngStripWriter(paths[0], size))
+        if "glow" in sources:
+            writers.append(PngStripWriter(paths[1], size))
+        for top in range(0, size[1], tile_rows):
+            rows = min(tile_rows, size[1] - top)
+            with stage(metrics, "load"):
+                bc = sources["bc"].strip(top, rows)
+                team = sources["team"].strip(top, rows, size)
+                mask = sources["mask"].strip(top, rows, size) if "mask" in sources else None
+            lit = None
+            if "glow" in sources:
+                with stage(metrics, "glow"):
+                    lit = glow_strip(sources["glow"], top, rows, size, **(glow or {}))
+            with stage(metrics, "bake"):
+                if lit is None:
+                    output = bake_team_color(bc, team, mask, color1, color2, mode)
+                else:
+                    output, glow_output = bake_glow(PreparedBake(bc, team, mask, mode), color1, color2, lit)
+            with stage(metrics, "save"):
+                writers[0].write(output)
+                if lit is not None:
+                    writers[1].write(glow_output)
+        with stage(metrics, "save"):
+            for writer in writers:
+                writer.close()
+        return [writer.file.name for writer in writers]
+    finally:
+        for writer in writers:
+            writer.file.close()
+        for source in sources.values():
+            source.close()
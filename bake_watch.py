@@ -0,0 +1,180 @@
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from bake_batch import ROLES, check_texture_set, resolve_mode, texture_sets
+from bake_pool import (allocate_block, bake_shared, block_names, decode_into_blocks, default_workers, faction_groups,
+                       finish_job, release_blocks, report_group, share_cores)
+
+# Watch mode: polls the source for saved textures and re-bakes only the ships
+# whose files changed. A burst of writes is waited out (the files must stay
+# unchanged for the debounce time) before anything is read. The worker pool
+# lives as long as the watch, and the decoded inputs of recently baked ships
+# stay in shared memory, so a save re-decodes just the file that was saved.
+
+POLL_INTERVAL = 0.2
+DEBOUNCE = 0.3
+KEEP_SHIPS = 8
+
+
+def file_stamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def ship_stamps(texture_set):
+    stamps = {role: file_stamp(texture_set[role]) for role in ROLES if role in texture_set}
+    if texture_set.get("badge"):
+        stamps["badge"] = file_stamp(texture_set["badge"]["path"])
+    return stamps
+
+
+def scan(source):
+    # {ship name: (texture_set, stamps)}, or None while a manifest is mid-write
+    try:
+        return {texture_set["name"]: (texture_set, ship_stamps(texture_set)) for texture_set in texture_sets(source)}
+    except (OSError, ValueError):
+        return None
+
+
+class Watcher:
+    def __init__(self, source, factions, out_dir, mode=None, workers=None, ext=".png", report=None, glow=None,
+                 debounce=DEBOUNCE, keep=KEEP_SHIPS):
+        self.source = source
+        self.factions = factions
+        self.out_dir = out_dir
+        self.mode = mode
+        self.workers = workers or default_workers()
+        self.ext = ext
+        self.report = report or (lambda *args: None)
+        self.glow = glow
+        self.debounce = debounce
+        self.keep = keep
+        # Spread a ship's factions over the pool: a save usually touches one ship
+        self.groups = faction_groups(factions, max(1, min(len(factions), self.workers)))
+        self.pool = None
+        self.baked = {}
+        self.snapshot = None
+        self.quiet_since = 0.0
+        # Ship name -> {"blocks": {role: (shm, size)}, "stamps": {role: stamp}}, least recently baked first
+        self.decoded = OrderedDict()
+
+    def start(self, bake_now=False):
+        self.pool = ProcessPoolExecutor(self.workers, initializer=share_cores, initargs=(self.workers,))
+        found = scan(self.source) or {}
+        if not bake_now:
+            self.baked = {name: stamps for name, (texture_set, stamps) in found.items()}
+        return len(found)
+
+    def stop(self):
+        for ship in self.decoded.values():
+            release_blocks(ship["blocks"])
+        self.decoded.clear()
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def poll(self, now=None):
+        # Returns (ships rebuilt, failures); nothing happens until the files stop changing
+        now = time.monotonic() if now is None else now
+        found = scan(self.source)
+        if found is None:
+            self.quiet_since = now
+            return [], 0
+        snapshot = {name: stamps for name, (texture_set, stamps) in found.items()}
+        if snapshot != self.snapshot:
+            self.snapshot = snapshot
+            self.quiet_since = now
+            return [], 0
+        if now - self.quiet_since < self.debounce:
+            return [], 0
+        for name in [name for name in self.decoded if name not in snapshot]:
+            release_blocks(self.decoded.pop(name)["blocks"])
+        changed = [found[name][0] for name in snapshot if self.baked.get(name) != snapshot[name]]
+        self.baked = {name: stamps for name, stamps in snapshot.items() if name in self.baked}
+        if not changed:
+            return [], 0
+        failures = self.rebuild(changed)
+        for texture_set in changed:
+            # Failed ships are retried on their next save, not on every poll
+            self.baked[texture_set["name"]] = snapshot[texture_set["name"]]
+        return changed, failures
+
+    def prepare(self, texture_set):
+        # Reuses the ship's blocks, re-decoding only roles whose file changed.
+        # Returns the names of the blocks to decode into
+        check_texture_set(texture_set)
+        ship = self.decoded.pop(texture_set["name"], None) or {"blocks": {}, "stamps": {}}
+        self.decoded[texture_set["name"]] = ship
+        stale = {}
+        for role in ROLES:
+            if role not in texture_set:
+                if role in ship["blocks"]:
+                    release_blocks({role: ship["blocks"].pop(role)})
+                continue
+            stamp = file_stamp(texture_set[role])
+            if role in ship["blocks"] and ship["stamps"].get(role) == stamp:
+                continue
+            block = allocate_block(texture_set[role])
+            if role in ship["blocks"]:
+                release_blocks({role: ship["blocks"][role]})
+            ship["blocks"][role] = block
+            ship["stamps"][role] = stamp
+            stale[role] = block
+        return ship, block_names(stale)
+
+    def forget(self, name):
+        ship = self.decoded.pop(name, None)
+        if ship is not None:
+            release_blocks(ship["blocks"])
+
+    def rebuild(self, sets):
+        failures = 0
+        decoding = {}
+        for texture_set in sets:
+            try:
+                ship, stale = self.prepare(texture_set)
+            except Exception as e:
+                self.forget(texture_set["name"])
+                failures += report_group(self.report, texture_set, self.factions, None, e)
+                continue
+            decoding[self.pool.submit(decode_into_blocks, texture_set, stale)] = (texture_set, ship)
+        baking = {}
+        for future in as_completed(decoding):
+            texture_set, ship = decoding[future]
+            error = future.exception()
+            if error is not None:
+                # Half-decoded blocks are not trusted for the next save
+                self.forget(texture_set["name"])
+                failures += report_group(self.report, texture_set, self.factions, None, error)
+                continue
+            names = block_names(ship["blocks"])
+            mode = resolve_mode(texture_set, self.mode)
+            for group in self.groups:
+                job = self.pool.submit(bake_shared, texture_set, names, group, mode, self.out_dir, self.ext, self.glow)
+                baking[job] = (texture_set, group)
+        for future in as_completed(baking):
+            texture_set, group = baking[future]
+            error = future.exception()
+            failures += finish_job(self.report, None, texture_set, group, None if error else future.result(), error)
+        while len(self.decoded) > self.keep:
+            name, ship = self.decoded.popitem(last=False)
+            release_blocks(ship["blocks"])
+        return failures
+
+    def run(self, bake_now=False, interval=POLL_INTERVAL, on_rebuild=None):
+        # Polls until interrupted; on_rebuild(ships, failures, seconds) after each rebuild
+        self.start(bake_now)
+        try:
+            while True:
+                started = time.perf_counter()
+                changed, failures = self.poll()
+                if changed and on_rebuild:
+                    on_rebuild(changed, failures, time.perf_counter() - started)
+                time.sleep(interval)
+        finally:
+            self.stop()
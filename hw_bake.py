@@ -0,0 +1,267 @@
+import argparse
+import json
+import signal
+import sys
+
+# Headless entry point: nothing here (or in the bake_* modules) imports tkinter,
+# so it runs on display-less machines.
+from bake_batch import parse_mode, texture_sets
+from bake_cache import DEFAULT_CACHE_SIZE, BakeCache, parse_size
+from bake_engine import BACKENDS
+from bake_metrics import BakeMetrics
+from bake_pool import bake_all
+from bake_project import DEFAULT_PROJECT_FILE, build_project
+from bake_raw import DEFAULT_RAW_CACHE_SIZE, RawTextureStore
+from bake_watch import DEBOUNCE, KEEP_SHIPS, Watcher
+from bake_presets import DEFAULT_PRESETS_FILE, hex_to_rgb_tuple, load_presets, normalize_hex, preset_colors
+
+
+def resolve_factions(args):
+    if args.colors:
+        primary, secondary = (hex_to_rgb_tuple(normalize_hex(c)) for c in args.colors)
+        return [("custom", (primary, secondary))]
+    presets = load_presets(args.presets)
+    names = list(presets) if args.all_presets else args.preset
+    return [(name, preset_colors(presets, name)) for name in names]
+
+
+def print_result(texture_set, faction, written, error):
+    if error is not None:
+        print(f"❌ {texture_set['name']} [{faction}]: {error}", file=sys.stderr)
+    else:
+        print(f"{texture_set['name']} [{faction}] -> {', '.join(written)}")
+
+
+def glow_options(args):
+    if args.glow_softness < 0 or args.glow_feather < 0:
+        raise ValueError("--glow-softness and --glow-feather must not be negative")
+    return {"softness": args.glow_softness, "feather": args.glow_feather}
+
+
+def cmd_bake(args):
+    if args.tile_rows and args.ext.lower() != ".png":
+        raise ValueError("Streaming bakes (--tile-rows) write PNG only")
+    if args.tile_rows and "numpy" not in BACKENDS:
+        raise ValueError("Streaming bakes (--tile-rows) need NumPy")
+    factions = resolve_factions(args)
+    glow = glow_options(args)
+    jobs = [] if args.metrics else None
+    cache = open_cache(args)
+    raw = raw_store(args)
+    failures = bake_all(texture_sets(args.source), factions, args.out, parse_mode(args.mode),
+                        args.jobs, args.ext, print_result, args.tile_rows, glow, jobs, cache, raw)
+    close_cache(cache)
+    close_raw_store(raw)
+    if args.metrics:
+        write_metrics(jobs, args.metrics)
+    return 1 if failures else 0
+
+
+def open_cache(args):
+    return BakeCache(args.cache, parse_size(args.cache_size)) if args.cache else None
+
+
+def raw_store(args):
+    return RawTextureStore(args.raw_cache, parse_size(args.raw_cache_size)) if args.raw_cache else None
+
+
+def close_raw_store(store):
+    if store is not None:
+        store.evict()
+
+
+def close_cache(cache):
+    if cache is not None:
+        evicted = cache.close()
+        print(f"Cache: {cache.hits} reused, {cache.misses} baked" + (f", {evicted} evicted" if evicted else ""))
+
+
+def cmd_build(args):
+    jobs = [] if args.metrics else None
+    cache = open_cache(args)
+    raw = raw_store(args)
+    stale, current, failures = build_project(args.project, args.jobs, print_result, args.force, args.dry_run, cache, jobs,
+                                             raw)
+    close_cache(cache)
+    close_raw_store(raw)
+    if args.dry_run:
+        for texture_set, factions in stale:
+            print(f"{texture_set['name']}: {', '.join(name for name, colors in factions)}")
+    outdated = sum(len(factions) for texture_set, factions in stale)
+    print(f"{outdated} outputs {'to rebuild' if args.dry_run else 'rebuilt'}, {current} up to date")
+    if args.metrics:
+        write_metrics(jobs, args.metrics)
+    return 1 if failures else 0
+
+
+def print_rebuild(sets, failures, seconds):
+    names = ", ".join(texture_set["name"] for texture_set in sets)
+    print(f"Rebuilt {names} in {seconds:.2f}s" + (f" ({failures} failed)" if failures else ""))
+
+
+def interrupt_on_sigterm():
+    # Long-running commands shut their worker pools down on SIGTERM as on Ctrl+C,
+    # instead of leaving the workers behind
+    def interrupt(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, interrupt)
+
+
+def cmd_watch(args):
+    watcher = Watcher(args.source, resolve_factions(args), args.out, parse_mode(args.mode), args.jobs, args.ext,
+                      print_result, glow_options(args), args.debounce, args.keep)
+    print(f"Watching {args.source} (Ctrl+C to stop)")
+    interrupt_on_sigterm()
+    try:
+        watcher.run(args.bake_now, on_rebuild=print_rebuild)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def cmd_serve(args):
+    # Imported here so other commands don't load the HTTP server
+    from bake_service import BakeService, make_server
+    service = BakeService(args.presets, args.jobs, args.queue)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving bakes on http://{args.host}:{server.server_address[1]}/bake (Ctrl+C to stop)")
+    interrupt_on_sigterm()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+def write_metrics(jobs, path):
+    totals = BakeMetrics()
+    for job in jobs:
+        totals.merge(job["stages"])
+    data = json.dumps({"jobs": jobs, "totals": totals.records()}, indent=2)
+    if path == "-":
+        print(data)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(data)
+
+
+def print_bench(result):
+    peak = result["peak_bytes"]
+    peak = "n/a" if peak is None else f"{peak / 2**20:.0f} MiB"
+    print(f"{result['size']:>5}² {result['mode']:<20} {result['stage']:<8} {result['seconds'] * 1000:9.1f} ms "
+          f"{result['megapixels_per_second']:9.1f} MP/s  peak +{peak}")
+
+
+def add_source_arguments(parser):
+    parser.add_argument("source", help="Directory of *_BC/*_DIFF, *_TEAM, *_MASK, *_GLOW textures, or a JSON manifest")
+    parser.add_argument("-o", "--out", required=True, help="Output directory")
+    colors = parser.add_mutually_exclusive_group(required=True)
+    colors.add_argument("-p", "--preset", action="append", help="Faction preset name (repeatable)")
+    colors.add_argument("--all-presets", action="store_true", help="Bake every preset in the presets file")
+    colors.add_argument("--colors", nargs=2, metavar=("PRIMARY", "SECONDARY"), help="Custom hex colors")
+    parser.add_argument("--presets", default=DEFAULT_PRESETS_FILE, help="Presets JSON (default: faction_color_presets_named.json)")
+    parser.add_argument("--mode", default="auto", choices=["auto", "hw3", "hwrm"],
+                        help="auto picks Remastered for sets with a GLOW and no MASK")
+    parser.add_argument("--glow-softness", type=int, default=0,
+                        help="Ramp the glow threshold over this many green levels each side of 128 (default: hard cut)")
+    parser.add_argument("--glow-feather", type=float, default=0.0, help="Gaussian blur radius for glow edges")
+    parser.add_argument("--ext", default=".png", help="Output file extension")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+
+
+def add_cache_arguments(parser):
+    parser.add_argument("--cache", metavar="DIR", help="Reuse earlier bakes of unchanged inputs from this directory")
+    parser.add_argument("--cache-size", default=str(DEFAULT_CACHE_SIZE),
+                        help="Cache size cap, e.g. 500M or 4G; least recently used bakes are evicted (default: 2G)")
+    parser.add_argument("--raw-cache", metavar="DIR",
+                        help="Keep decoded inputs here as memory-mapped raw RGBA, so later bakes skip decoding")
+    parser.add_argument("--raw-cache-size", default=str(DEFAULT_RAW_CACHE_SIZE),
+                        help="Raw cache size cap; least recently loaded inputs are evicted (default: 8G)")
+
+
+def cmd_bench(args):
+    # Imported here so bake runs don't pay for the benchmark module
+    from bake_bench import STAGES, compare, load_results, run_benchmarks, save_results
+    stages = args.stage or list(STAGES)
+    unknown = [stage for stage in stages if stage not in STAGES]
+    if unknown:
+        raise ValueError(f"Unknown stage: {', '.join(unknown)} (choose from {', '.join(STAGES)})")
+    modes = [parse_mode(mode) for mode in args.mode]
+    data = run_benchmarks(args.sizes, modes, stages, args.repeat, print_bench)
+    if args.output:
+        save_results(data, args.output)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        for result, speedup in compare(load_results(args.baseline), data):
+            print(f"{result['size']:>5}² {result['mode']:<20} {result['stage']:<8} {speedup:6.2f}x vs baseline")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="hw_bake", description="Headless Homeworld texture baker")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bake = subparsers.add_parser("bake", help="Bake texture sets from a directory or JSON manifest")
+    add_source_arguments(bake)
+    bake.add_argument("--tile-rows", type=int, default=None,
+                      help="Stream inputs and PNG output in strips of this many rows (for atlases larger than RAM)")
+    bake.add_argument("--metrics", metavar="PATH",
+                      help="Write per-stage wall/CPU time and peak memory of every job as JSON ('-' for stdout)")
+    add_cache_arguments(bake)
+    bake.set_defaults(func=cmd_bake)
+
+    build = subparsers.add_parser("build", help="Rebake only the outputs of a project that are out of date")
+    build.add_argument("project", nargs="?", default=DEFAULT_PROJECT_FILE,
+                       help="Project JSON (default: bake_project.json next to the presets)")
+    build.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+    build.add_argument("--force", action="store_true", help="Rebake every output")
+    build.add_argument("-n", "--dry-run", action="store_true", help="List out-of-date outputs without baking")
+    build.add_argument("--metrics", metavar="PATH", help="Write per-stage metrics of every job as JSON ('-' for stdout)")
+    add_cache_arguments(build)
+    build.set_defaults(func=cmd_build)
+
+    watch = subparsers.add_parser("watch", help="Re-bake ships whenever their textures are saved")
+    add_source_arguments(watch)
+    watch.add_argument("--debounce", type=float, default=DEBOUNCE,
+                       help="Seconds the files must stay unchanged before a re-bake (default: %(default)s)")
+    watch.add_argument("--keep", type=int, default=KEEP_SHIPS,
+                       help="Recently baked ships whose decoded textures stay in memory (default: %(default)s)")
+    watch.add_argument("--bake-now", action="store_true", help="Bake every ship once at startup")
+    watch.set_defaults(func=cmd_watch)
+
+    serve = subparsers.add_parser("serve", help="Run a local HTTP bake service")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: %(default)s)")
+    serve.add_argument("--port", type=int, default=8765, help="Port to listen on (default: %(default)s)")
+    serve.add_argument("--presets", default=DEFAULT_PRESETS_FILE, help="Presets JSON (default: faction_color_presets_named.json)")
+    serve.add_argument("-j", "--jobs", type=int, default=None, help="Worker processes (default: CPU count)")
+    serve.add_argument("--queue", type=int, default=None,
+                       help="Bakes running or waiting before new requests get 503 (default: twice the workers)")
+    serve.set_defaults(func=cmd_serve)
+
+    bench = subparsers.add_parser("bench", help="Benchmark the bake stages on synthetic textures")
+    bench.add_argument("--sizes", type=int, nargs="+", default=[512, 1024, 2048, 4096, 8192],
+                       help="Square texture sizes (default: 512 1024 2048 4096 8192)")
+    bench.add_argument("--mode", nargs="+", default=["hw3", "hwrm"], choices=["hw3", "hwrm"], help="Modes to run")
+    bench.add_argument("--stage", action="append",
+                       help="Stage to run (repeatable): load, bake, glow, badge, preview, save (default: all)")
+    bench.add_argument("--repeat", type=int, default=3, help="Timed runs per case; the median is reported")
+    bench.add_argument("-o", "--output", help="Write results as JSON")
+    bench.add_argument("--baseline", help="Earlier JSON results to compare against")
+    bench.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())